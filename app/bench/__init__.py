@@ -0,0 +1,2 @@
+from app.bench.generator import generate_rows, write_csv
+from app.bench.runner import run, compare, save, load, parse_size
@@ -0,0 +1,38 @@
+import argparse
+import json
+import sys
+
+from app.bench.runner import run, compare, save, load, parse_size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.bench', description='Бенчмарки app.db и app.utils')
+    parser.add_argument('--sizes', default='10k,100k', help='размеры книги через запятую: 10k,100k,1M,10M')
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', help='папка для временных баз (по умолчанию временная)')
+    parser.add_argument('--out', help='сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='сравнить с сохранёнными результатами')
+    parser.add_argument('--tolerance', type=float, default=0.20, help='допустимый рост p50, доля')
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    report = run(sizes, args.categories, args.repeat, args.seed, args.workdir)
+    if args.out:
+        save(report, args.out)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    if args.baseline:
+        regressions = compare(report, load(args.baseline), args.tolerance)
+        for r in regressions:
+            print(f"РЕГРЕССИЯ {r['size']} {r['benchmark']}: {r['baseline']:.2f} -> {r['current']:.2f} мс "
+                  f"(x{r['ratio']:.2f})", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
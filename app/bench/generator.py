@@ -0,0 +1,57 @@
+import csv
+import itertools
+import math
+import random
+from datetime import date, timedelta
+
+# генератор синтетической книги операций; при одном seed результат всегда одинаковый
+
+END_DATE = date(2025, 12, 31)
+INCOME_SHARE = 0.08
+
+
+def category_names(n):
+    return [f'Категория {i + 1:03d}' for i in range(n)]
+
+
+def generate_rows(n_rows, n_categories=50, years=5, seed=42):
+    rnd = random.Random(seed)
+    names = category_names(n_categories)
+    # популярность категорий по закону Ципфа: несколько частых и длинный хвост
+    cum_weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(n_categories)))
+    # у каждой категории свой типичный чек
+    scales = [math.log(rnd.uniform(150, 5000)) for _ in range(n_categories)]
+    days = years * 365
+    for i in range(n_rows):
+        # чем ближе к концу периода, тем больше операций
+        offset = int(days * (1.0 - math.sqrt(rnd.random())))
+        d = (END_DATE - timedelta(days=offset)).isoformat()
+        if rnd.random() < INCOME_SHARE:
+            yield {
+                'date': d,
+                'amount': round(rnd.lognormvariate(math.log(60000), 0.4), 2),
+                'type': 'Доход',
+                'category_name': 'Зарплата',
+                'note': f'Поступление {i}',
+            }
+        else:
+            c = rnd.choices(range(n_categories), cum_weights=cum_weights)[0]
+            yield {
+                'date': d,
+                'amount': round(rnd.lognormvariate(scales[c], 0.8), 2),
+                'type': 'Трата',
+                'category_name': names[c],
+                'note': f'Покупка {i}' if rnd.random() < 0.7 else '',
+            }
+
+
+def write_csv(path, rows):
+    keys = ['date', 'amount', 'type', 'category_name', 'note']
+    n = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=keys)
+        writer.writeheader()
+        for r in rows:
+            writer.writerow(r)
+            n += 1
+    return n
@@ -0,0 +1,151 @@
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Sequence
+from datetime import datetime
+
+from app import db, utils
+from app.bench.generator import generate_rows, write_csv
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+
+
+def parse_size(text):
+    if text in SIZES:
+        return SIZES[text]
+    t = text.strip().lower()
+    mult = 1
+    if t.endswith('k'):
+        mult, t = 1_000, t[:-1]
+    elif t.endswith('m'):
+        mult, t = 1_000_000, t[:-1]
+    return int(float(t) * mult)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def measure(fn, repeat=5, rows=None):
+    # время по нескольким прогонам + пиковая память Python-аллокаций отдельным прогоном
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if rows is None and isinstance(result, Sequence):
+        rows = len(result)
+    samples.sort()
+    stats = {
+        'runs': repeat,
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'p50_ms': _percentile(samples, 0.50) * 1000,
+        'p95_ms': _percentile(samples, 0.95) * 1000,
+        'p99_ms': _percentile(samples, 0.99) * 1000,
+        'peak_mem_kb': peak / 1024,
+    }
+    if rows:
+        stats['rows'] = rows
+        stats['rows_per_s'] = rows / max(_percentile(samples, 0.50), 1e-9)
+    return stats
+
+
+def run_size(n_rows, workdir, categories=50, repeat=5, seed=42):
+    db_path = os.path.join(workdir, f'bench_{n_rows}.db')
+    csv_path = os.path.join(workdir, f'bench_{n_rows}.csv')
+    out_path = os.path.join(workdir, f'bench_{n_rows}_out.csv')
+    for p in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(p):
+            os.remove(p)
+    db.set_db_path(db_path)
+    db.init_db()
+    write_csv(csv_path, generate_rows(n_rows, categories, seed=seed))
+
+    # импорт полностью перезаписывает таблицу, поэтому повторы корректны
+    import_repeat = 1 if n_rows >= 1_000_000 else min(repeat, 3)
+    results = {
+        'import_csv': measure(lambda: utils.import_csv(csv_path), import_repeat, rows=n_rows),
+        'get_balance': measure(db.get_balance, repeat),
+        'get_expenses_by_category': measure(db.get_expenses_by_category, repeat),
+        'get_transactions_page': measure(lambda: db.get_transactions_page(limit=500), repeat),
+        'get_transactions': measure(db.get_transactions, 1 if n_rows >= 1_000_000 else repeat),
+        'export_csv': measure(lambda: utils.export_csv(out_path), 1 if n_rows >= 1_000_000 else repeat, rows=n_rows),
+    }
+    db.close_pool()
+    return results
+
+
+def run(sizes, categories=50, repeat=5, seed=42, workdir=None):
+    prev_path = db.DB_PATH
+    tmp = None
+    if workdir is None:
+        tmp = tempfile.TemporaryDirectory(prefix='finance-bench-')
+        workdir = tmp.name
+    try:
+        report = {
+            'meta': {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'categories': categories,
+                'repeat': repeat,
+                'seed': seed,
+            },
+            'results': {},
+        }
+        for n in sizes:
+            report['results'][str(n)] = run_size(n, workdir, categories, repeat, seed)
+        return report
+    finally:
+        db.set_db_path(prev_path)
+        if tmp is not None:
+            tmp.cleanup()
+
+
+def save(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(report, baseline, tolerance=0.20, metric='p50_ms'):
+    # регрессия — рост метрики больше чем на tolerance относительно базовой линии
+    regressions = []
+    for size, benches in report['results'].items():
+        base_benches = baseline.get('results', {}).get(size, {})
+        for name, stats in benches.items():
+            base = base_benches.get(name)
+            if not base or not base.get(metric):
+                continue
+            ratio = stats[metric] / base[metric]
+            if ratio > 1.0 + tolerance:
+                regressions.append({
+                    'size': size,
+                    'benchmark': name,
+                    'metric': metric,
+                    'baseline': base[metric],
+                    'current': stats[metric],
+                    'ratio': ratio,
+                })
+    return regressions
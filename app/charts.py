@@ -0,0 +1,151 @@
+# matplotlib импортируется только здесь; модуль загружается после показа окна
+import itertools
+import math
+
+from matplotlib import rcParams
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+from matplotlib.patches import Wedge
+
+
+class PieCanvas(FigureCanvas):
+    # сектора строятся один раз; при изменении сумм с тем же набором категорий
+    # меняются только углы и подписи, а кадр собирается блиттингом поверх
+    # сохранённого фона всей фигуры: подписи выходят за пределы осей
+    def __init__(self, parent=None, width=4, height=3, dpi=100, max_slices=10):
+        fig = Figure(figsize=(width, height), dpi=dpi)
+        self.ax = fig.add_subplot(111)
+        super().__init__(fig)
+        self.setParent(parent)
+        # категории сверх max_slices - 1 сворачиваются в сектор «Другое»
+        self.max_slices = max_slices
+        self._totals = {}
+        self._key = None
+        self._labels = None
+        self._wedges, self._texts, self._pcts = [], [], []
+        self._background = None
+        self.mpl_connect('draw_event', self._on_draw)
+
+    def plot(self, data):
+        self._totals = {d['name']: d['total'] for d in data}
+        self._render()
+
+    def apply_deltas(self, deltas):
+        # обновляем суммы без повторного запроса к базе
+        for name, delta in deltas.items():
+            total = self._totals.get(name, 0.0) + delta
+            if total > 1e-9:
+                self._totals[name] = total
+            else:
+                self._totals.pop(name, None)
+        self._render()
+
+    def _slices(self):
+        items = sorted(self._totals.items(), key=lambda kv: kv[1], reverse=True)
+        if len(items) > self.max_slices:
+            head = items[:self.max_slices - 1]
+            items = head + [('Другое', sum(v for _, v in items[self.max_slices - 1:]))]
+        return [k for k, _ in items], [v for _, v in items]
+
+    def _render(self):
+        labels, sizes = self._slices()
+        # суммы в копейках: незначащие изменения не вызывают перерисовку
+        key = hash((tuple(labels), tuple(round(v, 2) for v in sizes)))
+        if key == self._key:
+            return
+        self._key = key
+        if labels == self._labels and self._background is not None:
+            self._update(sizes)
+        else:
+            self._draw_full(labels, sizes)
+
+    @staticmethod
+    def _angles(sizes):
+        total = sum(sizes)
+        theta = 0.0
+        for v in sizes:
+            span = 360.0 * v / total
+            yield theta, theta + span, v / total
+            theta += span
+
+    def _place(self, i, theta1, theta2, frac):
+        mid = math.radians((theta1 + theta2) / 2)
+        x, y = math.cos(mid), math.sin(mid)
+        self._wedges[i].set_theta1(theta1)
+        self._wedges[i].set_theta2(theta2)
+        self._texts[i].set_position((1.1 * x, 1.1 * y))
+        self._texts[i].set_horizontalalignment('left' if x > 0 else 'right')
+        self._pcts[i].set_position((0.6 * x, 0.6 * y))
+        # у узких секторов проценты налезают друг на друга
+        self._pcts[i].set_text(f'{frac * 100:.1f}%' if frac >= 0.03 else '')
+
+    def _draw_full(self, labels, sizes):
+        self.ax.clear()
+        self._wedges, self._texts, self._pcts = [], [], []
+        self._labels = labels
+        if not labels:
+            self.ax.text(0.5, 0.5, 'Нет данных', ha='center')
+            self.ax.set_axis_off()
+            self.draw()
+            return
+        colors = itertools.cycle(rcParams['axes.prop_cycle'].by_key()['color'])
+        for label in labels:
+            w = Wedge((0, 0), 1, 0, 0, facecolor=next(colors), animated=True)
+            self.ax.add_patch(w)
+            self._wedges.append(w)
+            self._texts.append(self.ax.text(0, 0, label, va='center', animated=True))
+            self._pcts.append(self.ax.text(0, 0, '', ha='center', va='center', animated=True))
+        for i, (t1, t2, frac) in enumerate(self._angles(sizes)):
+            self._place(i, t1, t2, frac)
+        self.ax.set(xlim=(-1.25, 1.25), ylim=(-1.25, 1.25), aspect='equal')
+        self.ax.set_axis_off()
+        self.draw()
+
+    def _update(self, sizes):
+        for i, (t1, t2, frac) in enumerate(self._angles(sizes)):
+            self._place(i, t1, t2, frac)
+        self.restore_region(self._background)
+        self._draw_animated()
+        self.blit(self.figure.bbox)
+
+    def _on_draw(self, event):
+        # полная отрисовка (в том числе после изменения размера) обновляет фон для блиттинга
+        self._background = self.copy_from_bbox(self.figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in (*self._wedges, *self._texts, *self._pcts):
+            self.ax.draw_artist(artist)
+
+
+class TrendCanvas(FigureCanvas):
+    # доходы и расходы по периодам столбцами, баланс на конец периода линией
+    def __init__(self, parent=None, width=4, height=3, dpi=100, last=24):
+        fig = Figure(figsize=(width, height), dpi=dpi)
+        self.ax = fig.add_subplot(111)
+        self.ax2 = self.ax.twinx()
+        super().__init__(fig)
+        self.setParent(parent)
+        self.last = last
+
+    def plot(self, report):
+        self.ax.clear()
+        self.ax2.clear()
+        periods = report['periods'][-self.last:] if report else []
+        if not periods:
+            self.ax.text(0.5, 0.5, 'Нет данных', ha='center')
+            self.draw()
+            return
+        n = len(periods)
+        x = range(n)
+        self.ax.bar([i - 0.2 for i in x], report['income'][-n:], width=0.4, color='tab:green', label='Доход')
+        self.ax.bar([i + 0.2 for i in x], report['expense'][-n:], width=0.4, color='tab:red', label='Трата')
+        self.ax2.plot(list(x), report['balance'][-n:], color='tab:blue', marker='.', label='Баланс')
+        step = max(1, n // 6)
+        self.ax.set_xticks(list(x)[::step])
+        self.ax.set_xticklabels(periods[::step], fontsize=7)
+        self.ax.tick_params(axis='y', labelsize=7)
+        self.ax2.tick_params(axis='y', labelsize=7)
+        self.ax.legend(loc='upper left', fontsize=7)
+        self.figure.tight_layout()
+        self.draw()
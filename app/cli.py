@@ -0,0 +1,163 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+from app import db
+from app.importer import import_files
+from app.utils import export_csv
+
+# консольный вход для пакетной работы без GUI: python -m app.cli <команда>;
+# Qt и matplotlib здесь не импортируются, результат печатается в stdout в JSON или CSV
+
+REPORT_FIELDS = ['period', 'income', 'expense', 'net', 'balance']
+
+
+def _print_json(data):
+    json.dump(data, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+def _db_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def cmd_import(args):
+    result = import_files(args.paths, mode=args.mode, reject_path=args.rejects, workers=args.workers)
+    result['rejects'] = [
+        {'file': src, 'line': line, 'error': err, 'fields': fields}
+        for src, line, err, fields in result['rejects']
+    ]
+    return result
+
+
+def cmd_export(args):
+    category_ids = args.category or None
+    rows = export_csv(args.path, date_from=args.date_from, date_to=args.date_to, category_ids=category_ids)
+    return {'path': args.path, 'rows': rows}
+
+
+def cmd_balance(args):
+    return {'balance': db.get_balance()}
+
+
+def cmd_report(args):
+    # numpy нужен только отчётам
+    from app.reports import period_report
+    report = period_report(args.period, args.date_from, args.date_to)
+    if args.format != 'csv':
+        return report
+    writer = csv.writer(sys.stdout)
+    writer.writerow(REPORT_FIELDS)
+    for i, period in enumerate(report['periods']):
+        writer.writerow([period] + [f'{report[k][i]:.2f}' for k in REPORT_FIELDS[1:]])
+    return None
+
+
+def cmd_vacuum(args):
+    before = _db_size(db.DB_PATH)
+    db.vacuum()
+    return {'path': db.DB_PATH, 'size_before': before, 'size_after': _db_size(db.DB_PATH)}
+
+
+def cmd_rebuild(args):
+    db.rebuild_aggregates()
+    return {'balance': db.get_balance()}
+
+
+def cmd_archive(args):
+    archived = [db.archive_year(year) for year in args.years]
+    if archived and args.vacuum:
+        db.vacuum()
+    return {'archived': archived, 'archives': db.get_archives(), 'archivable': db.archivable_years()}
+
+
+def cmd_budgets(args):
+    if args.set:
+        category_id, period, amount = args.set
+        db.set_budget(int(category_id), period, float(amount), args.threshold)
+    budgets = db.get_budgets(args.day)
+    return {'budgets': budgets, 'alerts': [b['id'] for b in budgets if b['status'] != 'ok']}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m app.cli', description='Пакетные операции с базой Finance Tracker')
+    parser.add_argument('--db', help='путь к базе (по умолчанию FINANCE_DB_PATH или data/finance.db)')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help='формат вывода отчётов')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('import', help='импорт CSV-файлов и папок')
+    p.add_argument('paths', nargs='+')
+    p.add_argument('--mode', choices=['merge', 'replace'], default='merge',
+                   help='merge — добавить новые строки, replace — заменить все операции')
+    p.add_argument('--rejects', help='CSV-отчёт о пропущенных строках')
+    p.add_argument('--workers', type=int, help='число процессов разбора (по умолчанию — все ядра)')
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser('export', help='экспорт в CSV (.csv, .csv.gz, .csv.zst)')
+    p.add_argument('path')
+    p.add_argument('--from', dest='date_from')
+    p.add_argument('--to', dest='date_to')
+    p.add_argument('--category', type=int, action='append', help='id категории, можно несколько раз')
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('balance', help='текущий баланс')
+    p.set_defaults(func=cmd_balance)
+
+    p = sub.add_parser('report', help='отчёт по периодам')
+    p.add_argument('--period', choices=['day', 'week', 'month', 'year'], default='month')
+    p.add_argument('--from', dest='date_from')
+    p.add_argument('--to', dest='date_to')
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser('vacuum', help='сжать файл базы')
+    p.set_defaults(func=cmd_vacuum)
+
+    p = sub.add_parser('archive', help='перенести закрытые годы в архивы только для чтения')
+    p.add_argument('years', nargs='*', type=int, help='годы; без них — только список архивов')
+    p.add_argument('--vacuum', action='store_true', help='сжать основную базу после переноса')
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser('budgets', help='бюджеты по категориям и их состояние')
+    p.add_argument('--day', help='дата YYYY-MM-DD, на которую проверяются бюджеты (по умолчанию сегодня)')
+    p.add_argument('--set', nargs=3, metavar=('CATEGORY_ID', 'PERIOD', 'AMOUNT'),
+                   help='задать лимит: PERIOD — week, month или year')
+    p.add_argument('--threshold', type=float, default=0.8, help='доля лимита для предупреждения (с --set)')
+    p.set_defaults(func=cmd_budgets)
+
+    p = sub.add_parser('rebuild-aggregates', help='пересчитать сводные таблицы и поисковый индекс')
+    p.set_defaults(func=cmd_rebuild)
+
+    # остальные параметры передаются в python -m app.bench как есть
+    p = sub.add_parser('bench', help='бенчмарки (параметры как у python -m app.bench)')
+    p.set_defaults(func=None)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if args.command == 'bench':
+        from app.bench.__main__ import main as bench_main
+        return bench_main(rest)
+    if rest:
+        parser.error('лишние аргументы: ' + ' '.join(rest))
+    if args.db:
+        db.set_db_path(args.db)
+    try:
+        db.init_db()
+        result = args.func(args)
+    except Exception as e:
+        json.dump({'error': str(e), 'type': type(e).__name__}, sys.stderr, ensure_ascii=False)
+        print(file=sys.stderr)
+        return 1
+    finally:
+        db.close_pool()
+    if result is not None:
+        _print_json(result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
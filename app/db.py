@@ -1,16 +1,34 @@
-import sys, os
+import sys, os, re
+import hashlib
+import logging
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from decimal import Decimal, ROUND_HALF_UP
 from pathlib import Path
 from datetime import datetime
 
+from app import events
+from app import instrument
+from app.events import ChangeEvent
+from app.instrument import instrumented
+from app.migrations import migrate, schema_version
+from app.pool import ConnectionPool
+from app.rows import TransactionRow, TransactionBatch, intern_or_none
+
+log = logging.getLogger(__name__)
+
 def resource_path(relative_path):
     if hasattr(sys, "_MEIPASS"):
         return os.path.join(sys._MEIPASS, relative_path)
     return os.path.join(os.path.abspath("."), relative_path)
 
 
-DB_PATH = resource_path("data/finance.db")
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+# путь можно переопределить переменной окружения или через set_db_path()
+DB_PATH = os.environ.get('FINANCE_DB_PATH') or resource_path("data/finance.db")
+os.makedirs(os.path.dirname(os.path.abspath(DB_PATH)), exist_ok=True)
 
 SCHEMA = [
     """
@@ -33,45 +51,231 @@ SCHEMA = [
     """,
 ]
 
+# суммы хранятся целыми числами в минимальных единицах (копейки, центы);
+# наружу app.db отдаёт и принимает обычные суммы в рублях/долларах
+MINOR_UNITS = 100
+DEFAULT_CURRENCY = 'RUB'
 
-def get_conn():
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    return conn
 
+def to_minor(amount):
+    return int((Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
 
-def init_db():
-    conn = get_conn()
+
+def from_minor(value):
+    return value / MINOR_UNITS if value is not None else 0.0
+
+
+def row_digest(date, amount, ttype, category, note):
+    # устойчивый 64-битный отпечаток содержимого операции (amount — в минимальных единицах);
+    # должен совпадать с отпечатком миграции 7
+    key = '\x1f'.join((date, str(amount), ttype, category or '', note or ''))
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def occurrence_hash(digest, k):
+    # k-я (с нуля) одинаковая строка одного файла получает свой row_hash
+    if k == 0:
+        return digest
+    data = digest.to_bytes(8, 'big', signed=True) + k.to_bytes(4, 'big')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+
+# порядок столбцов совпадает с app.rows.FIELDS
+_TX_FIELDS = (
+    "SELECT t.id, t.date, t.amount, t.currency, t.type, t.category_id, t.note,"
+    " c.name as category_name, c.icon_path as category_icon"
+)
+_TX_JOIN = " t LEFT JOIN categories c ON t.category_id=c.id"
+# только основная база — для изменений
+TX_SELECT = _TX_FIELDS + " FROM transactions" + _TX_JOIN
+# вся история: основная база и подключённые годовые архивы (см. _prepare_conn) — для чтения
+ALL_TX_SELECT = _TX_FIELDS + " FROM all_transactions" + _TX_JOIN
+
+
+def _tx_row(cursor, r):
+    # row_factory для выборок по TX_SELECT: сразу компактная строка, без sqlite3.Row и dict
+    return TransactionRow(r[0], intern_or_none(r[1]), from_minor(r[2]), intern_or_none(r[3]),
+                          intern_or_none(r[4]), r[5], r[6], intern_or_none(r[7]), intern_or_none(r[8]))
+
+
+def _select_rows(conn, q, params=()):
     cur = conn.cursor()
-    for s in SCHEMA:
-        cur.execute(s)
-    conn.commit()
-    conn.close()
+    cur.row_factory = _tx_row
+    return cur.execute(q, params)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH, prepare=_prepare_conn)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def set_db_path(path):
+    # переключение на другой файл базы (тесты, бенчмарки, CLI)
+    global DB_PATH
+    close_pool()
+    DB_PATH = str(path)
+    os.makedirs(os.path.dirname(os.path.abspath(DB_PATH)), exist_ok=True)
+    _tx_cache.clear()
+
+
+def get_conn(write=False):
+    # контекстный менеджер: соединение из пула + транзакция;
+    # write=True — для функций, которые пишут в базу (см. ConnectionPool.connection)
+    return get_pool().connection(write)
+
+
+def _notify(conn, event):
+    # событие уходит подписчикам после фиксации внешней транзакции
+    conn.after_commit.append(lambda: events.emit(event))
+
+
+def _signed(amount, ttype):
+    if ttype == 'Доход':
+        return amount
+    if ttype == 'Трата':
+        return -amount
+    return 0.0
+
+
+def _row_delta(row, sign, event):
+    # вклад одной строки в баланс и в суммы трат по категориям
+    event.balance_delta += sign * _signed(row['amount'], row['type'])
+    if row['type'] == 'Трата' and row['category_name'] is not None:
+        name = row['category_name']
+        event.expense_deltas[name] = event.expense_deltas.get(name, 0.0) + sign * row['amount']
+
+
+def _fetch_row(conn, tid):
+    return _select_rows(conn, TX_SELECT + " WHERE t.id=?", (tid,)).fetchone()
+
+
+@instrumented
+def init_db():
+    with get_conn(write=True) as conn:
+        # SCHEMA — исходная схема; всё, что появилось позже, создают миграции
+        # (сводные таблицы и их триггеры — миграция 3)
+        if schema_version(conn) == 0:
+            for s in SCHEMA:
+                conn.execute(s)
+        # ALTER TABLE проверяет и временные представления: all_transactions ссылается на
+        # main.transactions, которую миграция 3 пересоздаёт
+        conn.execute("DROP VIEW IF EXISTS temp.all_transactions")
+        conn.archive_epoch = None
+        migrate(conn)
+        # после миграций соединения заново подключают архивы и пересоздают all_transactions
+        conn.after_commit.append(_archives_changed)
+
+
+@instrumented
+def rebuild_aggregates():
+    # полный пересчёт сводных таблиц и поискового индекса (восстановление после сбоев)
+    with get_conn(write=True) as conn:
+        conn.execute("DELETE FROM category_totals")
+        conn.execute(
+            """
+            INSERT INTO category_totals (category_id, type, month, total, tx_count)
+            SELECT IFNULL(category_id, 0), type, substr(date, 1, 7), SUM(amount), COUNT(*)
+            FROM transactions GROUP BY 1, 2, 3
+            """
+        )
+        conn.execute("DELETE FROM daily_totals")
+        conn.execute(
+            """
+            INSERT INTO daily_totals (day, category_id, type, total, tx_count)
+            SELECT date, IFNULL(category_id, 0), type, SUM(amount), COUNT(*)
+            FROM transactions GROUP BY 1, 2, 3
+            """
+        )
+        conn.execute("DELETE FROM transactions_fts")
+        conn.execute(
+            """
+            INSERT INTO transactions_fts (rowid, note, category)
+            SELECT t.id, IFNULL(t.note, ''), IFNULL(c.name, '')
+            FROM transactions t LEFT JOIN categories c ON c.id = t.category_id
+            """
+        )
+        conn.execute("INSERT OR IGNORE INTO balance_summary (id) VALUES (1)")
+        conn.execute(
+            """
+            UPDATE balance_summary SET
+                balance = (SELECT IFNULL(SUM(CASE type WHEN 'Доход' THEN amount WHEN 'Трата' THEN -amount ELSE 0 END), 0) FROM transactions),
+                tx_count = (SELECT COUNT(*) FROM transactions),
+                version = version + 1
+            WHERE id = 1
+            """
+        )
+        # архивные годы — по суммам, посчитанным при архивации
+        registered = {r[0] for r in conn.execute("SELECT year FROM archives")}
+        for year, schema in conn.archives.items():
+            if year in registered:
+                _add_archive_totals(conn, schema)
+        _refill_budget_spent(conn)
+
+
+@instrumented
+def vacuum():
+    # сжатие файла базы; VACUUM не работает внутри транзакции, поэтому открытая пулом
+    # транзакция сразу фиксируется — вызывать только не из другой транзакции
+    with get_conn() as conn:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA optimize")
+
+
+@contextmanager
+def deferred_aggregates():
+    # на время массовых изменений триггеры не трогают сводные таблицы,
+    # в конце они пересчитываются одним запросом
+    with get_conn(write=True) as conn:
+        conn.execute("UPDATE balance_summary SET deferred = deferred + 1 WHERE id = 1")
+        yield conn
+        conn.execute("UPDATE balance_summary SET deferred = deferred - 1 WHERE id = 1")
+        if conn.execute("SELECT deferred FROM balance_summary WHERE id = 1").fetchone()[0] == 0:
+            rebuild_aggregates()
 
 # очистка бд
 
+@instrumented
 def clear_database():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM transactions")
-    cur.execute("DELETE FROM categories")
-    conn.commit()
-    conn.close()
+    with deferred_aggregates() as conn:
+        conn.execute("DELETE FROM transactions")
+        conn.execute("DELETE FROM categories")
+        conn.execute("DELETE FROM imported_files")
+        conn.execute("DELETE FROM bulk_journal")
+        # архивы отключаются (сводные таблицы пересчитаются уже без них), файлы остаются на диске
+        conn.execute("DELETE FROM archives")
+        conn.after_commit.append(_archives_changed)
+        _notify(conn, ChangeEvent(reset=True))
 
 # категории
 
+@instrumented
 def add_category(name, icon_path=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute("INSERT INTO categories (name, icon_path) VALUES (?,?)", (name, icon_path))
-        conn.commit()
-        return cur.lastrowid
-    except sqlite3.IntegrityError:
-        # в случае если уже существует
-        return None
-    finally:
-        conn.close()
+    with get_conn(write=True) as conn:
+        try:
+            cur = conn.execute("INSERT INTO categories (name, icon_path) VALUES (?,?)", (name, icon_path))
+            return cur.lastrowid
+        except sqlite3.IntegrityError:
+            # в случае если уже существует
+            return None
 
 # def add_category(name, icon=None):
 #     import sqlite3
@@ -83,102 +287,1099 @@ def add_category(name, icon_path=None):
 #     conn.close()
 #     return cid
 
+@instrumented
 def get_categories():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM categories ORDER BY name")
-    rows = cur.fetchall()
-    conn.close()
+    with get_conn() as conn:
+        rows = conn.execute("SELECT * FROM categories ORDER BY name").fetchall()
     return [dict(r) for r in rows]
 
 
+@instrumented
 def update_category(cat_id, name, icon_path):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE categories SET name=?, icon_path=? WHERE id=?", (name, icon_path, cat_id))
-    conn.commit()
-    conn.close()
+    with get_conn(write=True) as conn:
+        conn.execute("UPDATE categories SET name=?, icon_path=? WHERE id=?", (name, icon_path, cat_id))
+        _notify(conn, ChangeEvent(reset=True))
 
 
+@instrumented
 def delete_category(cat_id):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE transactions SET category_id=NULL WHERE category_id=?", (cat_id,))
-    cur.execute("DELETE FROM categories WHERE id=?", (cat_id,))
-    conn.commit()
-    conn.close()
+    with get_conn(write=True) as conn:
+        conn.execute("UPDATE transactions SET category_id=NULL WHERE category_id=?", (cat_id,))
+        conn.execute("DELETE FROM categories WHERE id=?", (cat_id,))
+        if conn.archives:
+            # архивные строки не меняются: их суммы переносятся в «без категории»,
+            # как это сделает и rebuild_aggregates
+            _fold_category_totals(conn, cat_id)
+        _notify(conn, ChangeEvent(reset=True))
 
 
 # транзакции
 
-def add_transaction(date: str, amount: float, ttype: str, category_id: int = None, note: str = ''):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO transactions (date, amount, type, category_id, note) VALUES (?,?,?,?,?)",
-        (date, amount, ttype, category_id, note)
-    )
-    conn.commit()
-    tid = cur.lastrowid
-    conn.close()
-    return tid
+@instrumented
+def add_transaction(date: str, amount: float, ttype: str, category_id: int = None, note: str = '',
+                    currency: str = DEFAULT_CURRENCY):
+    amount = to_minor(amount)
+    with get_conn(write=True) as conn:
+        cur = conn.execute(
+            "INSERT INTO transactions (date, amount, currency, type, category_id, note, row_hash) VALUES (?,?,?,?,?,?,?)",
+            (date, amount, currency, ttype, category_id, note,
+             _free_row_hash(conn, date, amount, ttype, category_id, note))
+        )
+        tid = cur.lastrowid
+        row = _fetch_row(conn, tid)
+        event = ChangeEvent(inserted=[row])
+        _row_delta(row, 1, event)
+        _notify(conn, event)
+        return tid
 
 
-def update_transaction(tid, date, amount, ttype, category_id, note):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE transactions SET date=?, amount=?, type=?, category_id=?, note=? WHERE id=?",
-        (date, amount, ttype, category_id, note, tid)
-    )
-    conn.commit()
-    conn.close()
+def _resolve_categories(conn, names, cats):
+    # одним проходом создаём недостающие категории и дополняем cats (имя -> id)
+    missing = set(names) - cats.keys()
+    missing.discard(None)
+    if missing:
+        conn.executemany("INSERT OR IGNORE INTO categories (name) VALUES (?)", [(n,) for n in missing])
+        marks = ','.join('?' * len(missing))
+        for r in conn.execute(f"SELECT id, name FROM categories WHERE name IN ({marks})", tuple(missing)):
+            cats[r['name']] = r['id']
+
+
+@instrumented
+def add_parsed_transactions(batches, progress=None):
+    # batches: пачки кортежей (date, amount, currency, type, category_name, note, row_hash), уже
+    # проверенных и приведённых к формату базы (сумма — в минимальных единицах), см. app.importer;
+    # единственный писатель: всё идёт одной транзакцией. Строки с уже известным row_hash
+    # пропускаются уникальным индексом; возвращается число добавленных строк
+    done = inserted = 0
+    with get_conn(write=True) as conn:
+        cats = {r['name']: r['id'] for r in conn.execute("SELECT id, name FROM categories")}
+        for batch in batches:
+            if conn.archives:
+                archived = _archived_hashes(conn, batch)
+                if archived:
+                    batch = [r for r in batch if r[6] not in archived]
+            if not batch:
+                continue
+            _resolve_categories(conn, (r[4] for r in batch), cats)
+            cur = conn.executemany(
+                "INSERT OR IGNORE INTO transactions (date, amount, currency, type, category_id, note, row_hash)"
+                " VALUES (?,?,?,?,?,?,?)",
+                [(d, a, c, t, cats.get(name), n, h) for d, a, c, t, name, n, h in batch]
+            )
+            inserted += cur.rowcount
+            done += len(batch)
+            if progress:
+                progress(done)
+        if inserted:
+            _notify(conn, ChangeEvent(reset=True))
+    return inserted
 
 
+@instrumented
+def known_files(fingerprints):
+    # какие из отпечатков файлов (sha256) уже импортированы
+    fingerprints = list(fingerprints)
+    if not fingerprints:
+        return set()
+    marks = ','.join('?' * len(fingerprints))
+    with get_conn() as conn:
+        rows = conn.execute(f"SELECT sha256 FROM imported_files WHERE sha256 IN ({marks})", fingerprints)
+        return {r[0] for r in rows}
+
+
+@instrumented
+def record_import(mode, started_at, files, imported, skipped, rejected):
+    # files: (sha256, path, size, rows) для каждого файла, из которого разобрана хотя бы одна строка
+    with get_conn(write=True) as conn:
+        cur = conn.execute(
+            "INSERT INTO import_sessions (started_at, finished_at, mode, files, imported, skipped, rejected)"
+            " VALUES (?,?,?,?,?,?,?)",
+            (started_at, datetime.now().isoformat(timespec='seconds'), mode, len(files), imported, skipped, rejected)
+        )
+        session_id = cur.lastrowid
+        conn.executemany(
+            "INSERT OR REPLACE INTO imported_files (sha256, path, size, rows, session_id) VALUES (?,?,?,?,?)",
+            [(sha, path, size, rows, session_id) for sha, path, size, rows in files]
+        )
+        return session_id
+
+
+@instrumented
+def update_transaction(tid, date, amount, ttype, category_id, note, currency=None):
+    with get_conn(write=True) as conn:
+        old = _fetch_row(conn, tid)
+        if old is None:
+            _check_not_archived(conn, tid)
+            return
+        conn.execute(
+            "UPDATE transactions SET date=?, amount=?, currency=IFNULL(?, currency), type=?, category_id=?, note=? WHERE id=?",
+            (date, to_minor(amount), currency, ttype, category_id, note, tid)
+        )
+        row = _fetch_row(conn, tid)
+        event = ChangeEvent(updated=[row])
+        _row_delta(old, -1, event)
+        _row_delta(row, 1, event)
+        _notify(conn, event)
+
+
+@instrumented
 def delete_transaction(tid):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM transactions WHERE id=?", (tid,))
-    conn.commit()
-    conn.close()
+    with get_conn(write=True) as conn:
+        old = _fetch_row(conn, tid)
+        if old is None:
+            _check_not_archived(conn, tid)
+            return
+        conn.execute("DELETE FROM transactions WHERE id=?", (tid,))
+        event = ChangeEvent(deleted=[tid])
+        _row_delta(old, -1, event)
+        _notify(conn, event)
 
 
+@instrumented
 def clear_transactions():
-    import sqlite3
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM transactions")
-    conn.commit()
-    conn.close()
+    # вместе с операциями забываются и импортированные файлы — их можно загрузить снова;
+    # годовые архивы не затрагиваются
+    with deferred_aggregates() as conn:
+        conn.execute("DELETE FROM transactions")
+        conn.execute("DELETE FROM imported_files")
+        conn.execute("DELETE FROM bulk_journal")
+        _notify(conn, ChangeEvent(reset=True))
 
 
-def get_transactions(limit=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    q = "SELECT t.*, c.name as category_name, c.icon_path as category_icon FROM transactions t LEFT JOIN categories c ON t.category_id=c.id ORDER BY date DESC"
+# массовые действия над выбранными строками: id кладутся во временную таблицу, изменение —
+# один UPDATE/DELETE ... WHERE id IN (SELECT id FROM temp.bulk_ids) в одной транзакции.
+# Прежние версии строк пишутся в журнал, последнее действие отменяет undo_bulk();
+# интерфейс получает одно событие со всеми изменёнными строками
+
+BULK_JOURNAL_SIZE = 20  # сколько последних действий можно отменить
+_JOURNAL_COLUMNS = "id, date, amount, currency, type, category_id, note, row_hash"
+# какие столбцы возвращает отмена: лишние столбцы в SET — лишние срабатывания триггеров и записи в индексы
+_UNDO_COLUMNS = {'delete': (), 'category': ('category_id',), 'type': ('type',), 'note': ('note',)}
+_UNDO_CATEGORY = "CASE WHEN j.category_id IN (SELECT id FROM categories) THEN j.category_id END"
+
+
+def _bulk_ids(conn, ids, condition=None, params=()):
+    # condition — условие на строку t основной базы: без него (архивные и уже удалённые
+    # строки) и строки, которые действие не изменит, в выборку не попадают
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.bulk_ids")
+    conn.executemany("INSERT OR IGNORE INTO temp.bulk_ids (id) VALUES (?)", ((int(i),) for i in ids))
+    conn.execute(
+        "DELETE FROM temp.bulk_ids WHERE NOT EXISTS (SELECT 1 FROM main.transactions t"
+        f" WHERE t.id = bulk_ids.id AND ({condition or '1'}))",
+        params
+    )
+
+
+def _bulk_rows(conn):
+    return _select_rows(conn, TX_SELECT + " WHERE t.id IN (SELECT id FROM temp.bulk_ids)").fetchall()
+
+
+def _bulk_event(old_rows, new_rows):
+    old = {r.id for r in old_rows}
+    new = {r.id for r in new_rows}
+    event = ChangeEvent(
+        inserted=[r for r in new_rows if r.id not in old],
+        updated=[r for r in new_rows if r.id in old],
+        deleted=[tid for tid in old if tid not in new],
+    )
+    for r in old_rows:
+        _row_delta(r, -1, event)
+    for r in new_rows:
+        _row_delta(r, 1, event)
+    return event
+
+
+def _bulk(ids, action, title, statement, statement_params=(), condition=None, condition_params=()):
+    with get_conn(write=True) as conn:
+        _bulk_ids(conn, ids, condition, condition_params)
+        old_rows = _bulk_rows(conn)
+        if not old_rows:
+            return {'journal_id': None, 'count': 0, 'skipped': len(ids)}
+        cur = conn.execute(
+            "INSERT INTO bulk_journal (created_at, action, description, tx_count) VALUES (?,?,?,?)",
+            (datetime.now().isoformat(timespec='seconds'), action, f'{title}: {len(old_rows)}', len(old_rows))
+        )
+        journal_id = cur.lastrowid
+        conn.execute(
+            f"INSERT INTO bulk_journal_rows (journal_id, {_JOURNAL_COLUMNS})"
+            f" SELECT ?, {_JOURNAL_COLUMNS} FROM transactions WHERE id IN (SELECT id FROM temp.bulk_ids)",
+            (journal_id,)
+        )
+        conn.execute(
+            "DELETE FROM bulk_journal WHERE id <= ?", (journal_id - BULK_JOURNAL_SIZE,)
+        )
+        conn.execute(statement + " WHERE id IN (SELECT id FROM temp.bulk_ids)", statement_params)
+        _notify(conn, _bulk_event(old_rows, _bulk_rows(conn)))
+    return {'journal_id': journal_id, 'count': len(old_rows), 'skipped': len(ids) - len(old_rows)}
+
+
+@instrumented
+def delete_transactions(ids):
+    # ids — id выбранных строк; возвращает {'journal_id', 'count', 'skipped'}
+    return _bulk(list(ids), 'delete', 'Удаление операций', "DELETE FROM transactions")
+
+
+@instrumented
+def set_transactions_category(ids, category_id):
+    return _bulk(
+        list(ids), 'category', 'Смена категории у операций',
+        "UPDATE transactions SET category_id = ?", (category_id,),
+        "t.category_id IS NOT ?", (category_id,)
+    )
+
+
+@instrumented
+def set_transactions_type(ids, ttype):
+    return _bulk(
+        list(ids), 'type', 'Смена типа у операций',
+        "UPDATE transactions SET type = ?", (ttype,),
+        "t.type <> ?", (ttype,)
+    )
+
+
+@instrumented
+def replace_in_notes(ids, find, replace):
+    # замена подстроки с учётом регистра; строки без неё не меняются и не попадают в журнал
+    if not find:
+        raise ValueError('пустая строка для поиска')
+    return _bulk(
+        list(ids), 'note', f'Замена «{find}» на «{replace}» в заметках',
+        "UPDATE transactions SET note = replace(note, ?, ?)", (find, replace),
+        "instr(t.note, ?) > 0", (find,)
+    )
+
+
+@instrumented
+def last_bulk_action():
+    with get_conn() as conn:
+        r = conn.execute(
+            "SELECT id, created_at, action, description, tx_count FROM bulk_journal ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    return dict(r) if r else None
+
+
+@instrumented
+def undo_bulk():
+    # отменяет последнее массовое действие: существующие строки возвращаются к прежним
+    # значениям одним UPDATE, удалённые вставляются обратно с теми же id. Строки, ушедшие
+    # с тех пор в архив, не трогаются; удалённые категории заменяются на «без категории»
+    with get_conn(write=True) as conn:
+        entry = conn.execute("SELECT id, action, description FROM bulk_journal ORDER BY id DESC LIMIT 1").fetchone()
+        if entry is None:
+            return None
+        journal_id = entry['id']
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.bulk_ids")
+        conn.execute("INSERT INTO temp.bulk_ids (id) SELECT id FROM bulk_journal_rows WHERE journal_id = ?", (journal_id,))
+        old_rows = _bulk_rows(conn)
+        columns = _UNDO_COLUMNS[entry['action']]
+        if columns and old_rows:
+            values = ', '.join(f"{c} = {_UNDO_CATEGORY if c == 'category_id' else 'j.' + c}" for c in columns)
+            conn.execute(
+                f"UPDATE transactions SET {values} FROM bulk_journal_rows j"
+                " WHERE j.journal_id = ? AND j.id = transactions.id",
+                (journal_id,)
+            )
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO transactions ({_JOURNAL_COLUMNS})
+            SELECT j.id, j.date, j.amount, j.currency, j.type, {_UNDO_CATEGORY}, j.note, j.row_hash
+            FROM bulk_journal_rows j
+            WHERE j.journal_id = ? AND NOT EXISTS (SELECT 1 FROM all_transactions a WHERE a.id = j.id)
+            """,
+            (journal_id,)
+        )
+        new_rows = _bulk_rows(conn)
+        conn.execute("DELETE FROM bulk_journal WHERE id = ?", (journal_id,))
+        _notify(conn, _bulk_event(old_rows, new_rows))
+    return {'description': entry['description'], 'count': len(new_rows)}
+
+
+class _LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# недавно открытые транзакции; сбрасывается по событиям изменений
+_tx_cache = _LRUCache()
+
+
+def _invalidate_tx_cache(event):
+    if event.reset:
+        _tx_cache.clear()
+        return
+    for row in event.updated:
+        _tx_cache.pop(row['id'])
+    for tid in event.deleted:
+        _tx_cache.pop(tid)
+
+
+events.subscribe(_invalidate_tx_cache)
+
+
+@instrumented
+def get_transaction(tid):
+    row = _tx_cache.get(tid)
+    if row is None:
+        with get_conn() as conn:
+            row = _select_rows(conn, ALL_TX_SELECT + " WHERE t.id=?", (tid,)).fetchone()
+        if row is None:
+            return None
+        _tx_cache.put(tid, row)
+    # строки неизменяемы, поэтому из кэша отдаётся сам объект
+    return row
+
+
+@instrumented
+def get_transactions(limit=None, chunk_size=5000):
+    # полная выборка в столбцах (TransactionBatch): элементы — TransactionRow, создаются при обращении
+    q = ALL_TX_SELECT + " ORDER BY date DESC"
     if limit:
         q += f" LIMIT {int(limit)}"
-    cur.execute(q)
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    batch = TransactionBatch()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.row_factory = None
+        cur.execute(q)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            for tid, date, amount, currency, ttype, cid, note, cname, cicon in rows:
+                batch.append(tid, date, from_minor(amount), currency, ttype, cid, note, cname, cicon)
+    return batch
+
+
+@instrumented
+def get_transactions_page(after=None, limit=500):
+    # keyset-пагинация по (date, id) от новых к старым;
+    # after — (date, id) последней загруженной строки
+    q = ALL_TX_SELECT
+    params = []
+    if after is not None:
+        q += " WHERE (t.date, t.id) < (?, ?)"
+        params += list(after)
+    q += " ORDER BY t.date DESC, t.id DESC LIMIT ?"
+    params.append(int(limit))
+    with get_conn() as conn:
+        return _select_rows(conn, q, params).fetchall()
+
 
+def _filter_sql(date_from=None, date_to=None, category_ids=None, ttype=None, amount_min=None, amount_max=None):
+    # условия WHERE и параметры для фильтров; None в category_ids — «без категории»
+    clauses, params = [], []
+    if date_from:
+        clauses.append("t.date >= ?")
+        params.append(date_from)
+    if date_to:
+        clauses.append("t.date <= ?")
+        params.append(date_to)
+    if ttype:
+        clauses.append("t.type = ?")
+        params.append(ttype)
+    if amount_min is not None:
+        clauses.append("t.amount >= ?")
+        params.append(to_minor(amount_min))
+    if amount_max is not None:
+        clauses.append("t.amount <= ?")
+        params.append(to_minor(amount_max))
+    if category_ids is not None:
+        ids = [c for c in category_ids if c is not None]
+        parts = []
+        if ids:
+            parts.append(f"t.category_id IN ({','.join('?' * len(ids))})")
+            params += ids
+        if len(ids) != len(category_ids):
+            parts.append("t.category_id IS NULL")
+        clauses.append('(' + ' OR '.join(parts) + ')' if parts else '0')
+    return clauses, params
 
+
+# столбец сортировки -> выражение; у каждого есть индекс вида (столбец, id)
+SORT_COLUMNS = {'date': 't.date', 'amount': 't.amount'}
+
+
+@dataclass
+class TransactionFilter:
+    date_from: str = None
+    date_to: str = None
+    ttype: str = None
+    category_ids: list = None
+    amount_min: float = None
+    amount_max: float = None
+    sort: str = 'date'
+    descending: bool = True
+
+    def is_default(self):
+        return self == TransactionFilter()
+
+    def cursor(self, row):
+        # keyset-курсор для строки, загруженной последней
+        value = to_minor(row['amount']) if self.sort == 'amount' else row[self.sort]
+        return value, row['id']
+
+
+def _history_source(conn, date_from=None, date_to=None, match=None):
+    # источник строк для выборки по всей истории -> (SQL для FROM, параметры):
+    # архивы вне диапазона дат не участвуют, основная база — тоже, если в ней нет
+    # строк этого диапазона; при поиске каждая ветка отбирается своим индексом FTS.
+    # Категории в FTS архива — названия на момент переноса, поэтому в архивах слово
+    # ищется в заметке или в текущих названиях категорий (categories_fts основной базы)
+    if not match and not (conn.archives and (date_from or date_to)):
+        return 'all_transactions', []
+    lo, hi = date_from or '', date_to or '9999'
+    schemas = [s for y, s in conn.archives.items() if f'{y:04d}-01-01' <= hi and lo < f'{y + 1:04d}-01-01']
+    first, last = conn.execute(
+        "SELECT (SELECT MIN(date) FROM transactions), (SELECT MAX(date) FROM transactions)"
+    ).fetchone()
+    if not schemas or (first is not None and first <= hi and last >= lo):
+        schemas.insert(0, 'main')
+    parts, params = [], []
+    for s in schemas:
+        sql = f"SELECT {_VIEW_COLUMNS} FROM {s}.transactions"
+        if match and s == 'main':
+            sql += " WHERE id IN (SELECT rowid FROM main.transactions_fts WHERE transactions_fts MATCH ?)"
+            params.append(match)
+        elif match:
+            # пересечение по словам: (заметка подходит) ∪ (строки подходящих категорий)
+            terms = match.split(' AND ')
+            sql += " WHERE id IN (" + " INTERSECT ".join(
+                f"SELECT id FROM (SELECT rowid AS id FROM {s}.transactions_fts WHERE transactions_fts MATCH ?"
+                f" UNION SELECT id FROM {s}.transactions WHERE category_id IN"
+                " (SELECT rowid FROM main.categories_fts WHERE categories_fts MATCH ?))"
+                for _ in terms
+            ) + ")"
+            for term in terms:
+                params += ['note : ' + term, term]
+        parts.append(sql)
+    return '(' + ' UNION ALL '.join(parts) + ')', params
+
+
+def _page_sql(conn, flt, after=None, match=None):
+    # постраничная выборка: фильтры, поиск и курсор превращаются в параметризованный
+    # запрос, порядок — (столбец сортировки, id), чтобы курсор был однозначным
+    if flt.sort not in SORT_COLUMNS:
+        raise ValueError(f'неизвестная сортировка: {flt.sort}')
+    fields = asdict(flt)
+    del fields['sort'], fields['descending']
+    source, params = _history_source(conn, flt.date_from, flt.date_to, match)
+    clauses, filter_params = _filter_sql(**fields)
+    params += filter_params
+    col = SORT_COLUMNS[flt.sort]
+    direction, op = ('DESC', '<') if flt.descending else ('ASC', '>')
+    if after is not None:
+        clauses.append(f"({col}, t.id) {op} (?, ?)")
+        params += list(after)
+    q = _TX_FIELDS + " FROM " + source + _TX_JOIN
+    if clauses:
+        q += " WHERE " + " AND ".join(clauses)
+    q += f" ORDER BY {col} {direction}, t.id {direction} LIMIT ? OFFSET ?"
+    return q, params
+
+
+def _as_filter(filters):
+    if filters is None:
+        return TransactionFilter()
+    if isinstance(filters, dict):
+        return TransactionFilter(**filters)
+    return filters
+
+
+@instrumented
+def query_transactions(filters=None, after=None, limit=500):
+    # filters — TransactionFilter или словарь с его полями;
+    # after — курсор последней строки предыдущей страницы (TransactionFilter.cursor)
+    with get_conn() as conn:
+        q, params = _page_sql(conn, _as_filter(filters), after)
+        return _select_rows(conn, q, [*params, int(limit), 0]).fetchall()
+
+
+@instrumented
+def iter_transactions(chunk_size=1000, date_from=None, date_to=None, category_ids=None):
+    # потоковое чтение без загрузки всей таблицы в память; каждый кусок читается своим
+    # запросом по keyset-курсору (date, id), и соединение не остаётся занятым между yield
+    after = None
+    while True:
+        with get_conn() as conn:
+            source, params = _history_source(conn, date_from, date_to)
+            clauses, filter_params = _filter_sql(date_from, date_to, category_ids)
+            params += filter_params
+            if after is not None:
+                clauses.append("(t.date, t.id) < (?, ?)")
+                params += after
+            q = _TX_FIELDS + " FROM " + source + _TX_JOIN
+            if clauses:
+                q += " WHERE " + " AND ".join(clauses)
+            q += " ORDER BY t.date DESC, t.id DESC LIMIT ?"
+            rows = _select_rows(conn, q, [*params, int(chunk_size)]).fetchall()
+        yield from rows
+        if len(rows) < chunk_size:
+            break
+        after = [rows[-1]['date'], rows[-1]['id']]
+
+
+def fts_query(text):
+    # пользовательский ввод -> запрос FTS5: каждое слово как префикс, все слова обязательны;
+    # кавычки экранируются, поэтому синтаксис FTS5 во вводе не срабатывает;
+    # _history_source делит запрос на слова по ' AND '
+    words = re.findall(r'\w+', text or '')
+    return ' AND '.join('"' + w.replace('"', '""') + '"*' for w in words)
+
+
+@instrumented
+def search_transactions(query, filters=None, limit=100, offset=0, after=None):
+    # filters — как в query_transactions; страницы можно брать по offset или курсору after
+    match = fts_query(query)
+    if not match:
+        return []
+    with get_conn() as conn:
+        q, params = _page_sql(conn, _as_filter(filters), after, match)
+        return _select_rows(conn, q, [*params, int(limit), int(offset)]).fetchall()
+
+
+@instrumented
+def get_data_version():
+    # растёт при каждом изменении transactions (см. триггеры сводных таблиц)
+    with get_conn() as conn:
+        r = conn.execute("SELECT version FROM balance_summary WHERE id=1").fetchone()
+    return r['version'] if r else 0
+
+
+@instrumented
 def get_balance():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT SUM(CASE WHEN type='Доход' THEN amount WHEN type='Трата' THEN -amount ELSE 0 END) as balance FROM transactions")
-    r = cur.fetchone()
-    conn.close()
-    return r['balance'] if r and r['balance'] is not None else 0.0
+    with get_conn() as conn:
+        r = conn.execute("SELECT balance FROM balance_summary WHERE id=1").fetchone()
+    return from_minor(r['balance']) if r else 0.0
 
 
+@instrumented
 def get_expenses_by_category():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT c.name, SUM(t.amount) as total FROM transactions t JOIN categories c ON t.category_id=c.id WHERE t.type='Трата' GROUP BY c.id ORDER BY total DESC"
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT c.name, SUM(a.total) as total FROM category_totals a JOIN categories c ON a.category_id=c.id WHERE a.type='Трата' GROUP BY c.id ORDER BY total DESC"
+        ).fetchall()
+    return [{'name': r['name'], 'total': from_minor(r['total'])} for r in rows]
+
+
+# бюджеты: лимит трат по категории на неделю, месяц или год. Потраченное за каждый период
+# хранится в budget_spent и меняется триггерами при каждой записи (миграция 10), поэтому
+# проверка бюджетов — по одному чтению по первичному ключу на бюджет, без просмотра истории
+
+BUDGET_PERIODS = ('week', 'month', 'year')
+
+
+def _budget_period_sql(day):
+    # начало периода бюджета b, в который попадает дата day; неделя начинается с понедельника
+    return (f"CASE b.period WHEN 'week' THEN date({day}, '-6 days', 'weekday 1')"
+            f" WHEN 'year' THEN substr({day}, 1, 4) || '-01-01'"
+            f" ELSE substr({day}, 1, 7) || '-01' END")
+
+
+def _refill_budget_spent(conn, budget_id=None):
+    # счётчики по дневным суммам (в них учтены и архивные годы): для нового бюджета
+    # и после пересчёта сводных таблиц
+    conn.execute("DELETE FROM budget_spent WHERE ?1 IS NULL OR budget_id = ?1", (budget_id,))
+    conn.execute(
+        f"""
+        INSERT INTO budget_spent (budget_id, period_start, spent)
+        SELECT b.id, {_budget_period_sql('d.day')}, SUM(d.total)
+        FROM budgets b JOIN daily_totals d ON d.category_id = b.category_id AND d.type = 'Трата'
+        WHERE ?1 IS NULL OR b.id = ?1
+        GROUP BY 1, 2
+        """,
+        (budget_id,)
+    )
+
+
+@instrumented
+def set_budget(category_id, period, amount, threshold=0.8):
+    # новый бюджет или новый лимит существующего (одна категория — один бюджет на период);
+    # threshold — доля лимита, начиная с которой показывается предупреждение
+    if period not in BUDGET_PERIODS:
+        raise ValueError(f'неизвестный период бюджета: {period}')
+    if amount <= 0:
+        raise ValueError('лимит бюджета должен быть больше нуля')
+    if not 0 < threshold <= 1:
+        raise ValueError('порог предупреждения — доля лимита от 0 до 1')
+    with get_conn(write=True) as conn:
+        conn.execute(
+            """
+            INSERT INTO budgets (category_id, period, amount, threshold) VALUES (?,?,?,?)
+            ON CONFLICT (category_id, period) DO UPDATE SET amount = excluded.amount, threshold = excluded.threshold
+            """,
+            (category_id, period, to_minor(amount), threshold)
+        )
+        budget_id = conn.execute(
+            "SELECT id FROM budgets WHERE category_id=? AND period=?", (category_id, period)
+        ).fetchone()[0]
+        _refill_budget_spent(conn, budget_id)
+    return budget_id
+
+
+@instrumented
+def delete_budget(budget_id):
+    with get_conn(write=True) as conn:
+        conn.execute("DELETE FROM budgets WHERE id=?", (budget_id,))
+
+
+@instrumented
+def get_budgets(day=None):
+    # состояние бюджетов на дату day (по умолчанию сегодня): status — 'ok', 'warning'
+    # (потрачено не меньше threshold от лимита) или 'over' (лимит превышен)
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    with get_conn() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT b.id, b.category_id, c.name AS category_name, b.period, b.amount, b.threshold,
+                   {_budget_period_sql(':day')} AS period_start, IFNULL(s.spent, 0) AS spent
+            FROM budgets b
+            JOIN categories c ON c.id = b.category_id
+            LEFT JOIN budget_spent s ON s.budget_id = b.id AND s.period_start = {_budget_period_sql(':day')}
+            ORDER BY c.name, b.period
+            """,
+            {'day': day}
+        ).fetchall()
+    budgets = []
+    for r in rows:
+        if r['spent'] > r['amount']:
+            status = 'over'
+        elif r['spent'] >= r['amount'] * r['threshold']:
+            status = 'warning'
+        else:
+            status = 'ok'
+        budgets.append(dict(
+            r, amount=from_minor(r['amount']), spent=from_minor(r['spent']),
+            ratio=r['spent'] / r['amount'], status=status
+        ))
+    return budgets
+
+
+@instrumented
+def budget_alerts(day=None):
+    return [b for b in get_budgets(day) if b['status'] != 'ok']
+
+
+# годовые архивы: операции закрытого года переносятся в отдельный файл только для чтения
+# (data/archive/finance_2021.db). Архивы подключаются к каждому соединению пула через ATTACH,
+# строки читаются через временное представление all_transactions (UNION ALL по основной базе
+# и архивам — sqlite сливает ветки по их индексам). Сводные таблицы основной базы по-прежнему
+# учитывают архивные годы, поэтому баланс и отчёты не зависят от того, где лежат строки
+
+ARCHIVE_FORMAT = 1  # PRAGMA user_version файла архива
+_ARCHIVE_COLUMNS = "id, date, amount, currency, type, category_id, note, row_hash"
+_VIEW_COLUMNS = "id, date, amount, currency, type, category_id, note"
+
+ARCHIVE_SCHEMA = [
+    """
+    CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY, -- id из основной базы
+        date TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        currency TEXT NOT NULL,
+        type TEXT NOT NULL,
+        category_id INTEGER, -- категории остаются в основной базе
+        note TEXT,
+        row_hash INTEGER
+    )
+    """,
+    """
+    CREATE TABLE category_totals (
+        category_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        month TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (category_id, type, month)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE daily_totals (
+        day TEXT NOT NULL,
+        category_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        tx_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, category_id, type)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE archive_info (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        year INTEGER NOT NULL,
+        tx_count INTEGER NOT NULL,
+        balance INTEGER NOT NULL,
+        amount_sum INTEGER NOT NULL, -- amount_sum и id_sum — для сверки при переносе
+        id_sum INTEGER NOT NULL,
+        first_date TEXT,
+        last_date TEXT,
+        created_at TEXT NOT NULL
     )
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
\ No newline at end of file
+    """,
+    """
+    CREATE VIRTUAL TABLE transactions_fts USING fts5(
+        note, category,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+]
+
+# те же индексы, что у основной базы; строятся после заполнения таблицы
+ARCHIVE_INDEXES = [
+    "CREATE INDEX idx_transactions_date_id ON transactions (date DESC, id DESC)",
+    "CREATE INDEX idx_transactions_category_date ON transactions (category_id, date DESC, id DESC)",
+    "CREATE INDEX idx_transactions_amount_id ON transactions (amount DESC, id DESC)",
+    "CREATE UNIQUE INDEX idx_transactions_row_hash ON transactions (row_hash)",
+]
+
+# номер списка архивов; соединение, подключённое к другому номеру, переподключается
+_archive_epoch = 0
+
+
+def _archives_changed():
+    global _archive_epoch
+    _archive_epoch += 1
+
+
+def _archive_file(rel_path):
+    # пути архивов хранятся относительно папки основной базы
+    return os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), rel_path)
+
+
+def _readonly_uri(path):
+    return Path(os.path.abspath(path)).as_uri() + '?mode=ro'
+
+
+def _prepare_conn(conn):
+    # вызывается пулом до BEGIN; обычно это одно сравнение номера
+    epoch = _archive_epoch
+    if conn.archive_epoch == epoch:
+        return
+    conn.execute("DROP VIEW IF EXISTS temp.all_transactions")
+    for schema in conn.archives.values():
+        conn.execute(f"DETACH DATABASE {schema}")
+    conn.archives = {}
+    registry = []
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='archives'").fetchone():
+        registry = conn.execute("SELECT year, path FROM archives ORDER BY year DESC").fetchall()
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    for year, rel_path in registry:
+        path = _archive_file(rel_path)
+        if not os.path.exists(path):
+            log.warning('архив за %s год не найден: %s', year, path)
+            continue
+        if len(conn.archives) >= limit:
+            log.warning('подключено предельное число архивов (%s), остальные пропущены', limit)
+            break
+        schema = f'archive_{int(year)}'
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (_readonly_uri(path),))
+        conn.archives[year] = schema
+    conn.execute(
+        "CREATE TEMP VIEW all_transactions AS "
+        + " UNION ALL ".join(f"SELECT {_VIEW_COLUMNS} FROM {s}.transactions" for s in ('main', *conn.archives.values()))
+    )
+    conn.archive_epoch = epoch
+
+
+def _add_archive_totals(conn, schema):
+    # категории, удалённые после архивации, считаются «без категории»
+    category = "CASE WHEN a.category_id IN (SELECT id FROM main.categories) THEN a.category_id ELSE 0 END"
+    conn.execute(
+        f"""
+        INSERT INTO category_totals (category_id, type, month, total, tx_count)
+        SELECT {category}, a.type, a.month, SUM(a.total), SUM(a.tx_count)
+        FROM {schema}.category_totals a GROUP BY 1, 2, 3
+        ON CONFLICT (category_id, type, month) DO UPDATE SET
+            total = total + excluded.total,
+            tx_count = tx_count + excluded.tx_count
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO daily_totals (day, category_id, type, total, tx_count)
+        SELECT a.day, {category}, a.type, SUM(a.total), SUM(a.tx_count)
+        FROM {schema}.daily_totals a GROUP BY 1, 2, 3
+        ON CONFLICT (day, category_id, type) DO UPDATE SET
+            total = total + excluded.total,
+            tx_count = tx_count + excluded.tx_count
+        """
+    )
+    conn.execute(
+        f"""
+        UPDATE balance_summary SET
+            balance = balance + (SELECT balance FROM {schema}.archive_info),
+            tx_count = tx_count + (SELECT tx_count FROM {schema}.archive_info)
+        WHERE id = 1
+        """
+    )
+
+
+def _fold_category_totals(conn, cat_id):
+    conn.execute(
+        """
+        INSERT INTO category_totals (category_id, type, month, total, tx_count)
+        SELECT 0, type, month, total, tx_count FROM category_totals WHERE category_id = ?
+        ON CONFLICT (category_id, type, month) DO UPDATE SET
+            total = total + excluded.total,
+            tx_count = tx_count + excluded.tx_count
+        """,
+        (cat_id,)
+    )
+    conn.execute("DELETE FROM category_totals WHERE category_id = ?", (cat_id,))
+    conn.execute(
+        """
+        INSERT INTO daily_totals (day, category_id, type, total, tx_count)
+        SELECT day, 0, type, total, tx_count FROM daily_totals WHERE category_id = ?
+        ON CONFLICT (day, category_id, type) DO UPDATE SET
+            total = total + excluded.total,
+            tx_count = tx_count + excluded.tx_count
+        """,
+        (cat_id,)
+    )
+    conn.execute("DELETE FROM daily_totals WHERE category_id = ?", (cat_id,))
+
+
+def _archived_hashes(conn, batch, chunk=500):
+    # row_hash строк пачки (кортежи add_parsed_transactions), которые уже лежат в архивах:
+    # уникальный индекс основной базы архивы не видит; проверяются только строки архивных лет
+    by_schema = {}
+    for r in batch:
+        schema = conn.archives.get(int(r[0][:4]))
+        if schema is not None:
+            by_schema.setdefault(schema, []).append(r[6])
+    found = set()
+    for schema, hashes in by_schema.items():
+        for i in range(0, len(hashes), chunk):
+            part = hashes[i:i + chunk]
+            rows = conn.execute(
+                f"SELECT row_hash FROM {schema}.transactions WHERE row_hash IN ({','.join('?' * len(part))})", part
+            )
+            found.update(r[0] for r in rows)
+    return found
+
+
+def _free_row_hash(conn, date, amount, ttype, category_id, note):
+    # row_hash для строки, введённой вручную: как у k-го повтора в файле импорта, где k —
+    # число таких же строк в базе; тогда повторный импорт этой строки её не задвоит
+    r = conn.execute("SELECT name FROM categories WHERE id=?", (category_id,)).fetchone()
+    digest = row_digest(date, amount, ttype, r[0] if r else None, note)
+    schema = conn.archives.get(int(date[:4]))
+    k = 0
+    while True:
+        h = occurrence_hash(digest, k)
+        if conn.execute("SELECT 1 FROM transactions WHERE row_hash=?", (h,)).fetchone() is None and (
+                schema is None
+                or conn.execute(f"SELECT 1 FROM {schema}.transactions WHERE row_hash=?", (h,)).fetchone() is None):
+            return h
+        k += 1
+
+
+def _check_not_archived(conn, tid):
+    r = conn.execute("SELECT date FROM all_transactions WHERE id=?", (tid,)).fetchone()
+    if r is not None:
+        raise ValueError(f'операция за {r[0][:4]} год находится в архиве и не изменяется')
+
+
+def _build_archive(path, year):
+    # файл собирается отдельным соединением под временным именем, основная база
+    # подключается только для чтения; возвращает строку archive_info
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp, isolation_level=None, uri=True)
+    try:
+        conn.execute("ATTACH DATABASE ? AS hot", (_readonly_uri(DB_PATH),))
+        conn.execute("BEGIN")
+        for sql in ARCHIVE_SCHEMA:
+            conn.execute(sql)
+        conn.execute(
+            f"INSERT INTO main.transactions ({_ARCHIVE_COLUMNS}) SELECT {_ARCHIVE_COLUMNS} FROM hot.transactions"
+            " WHERE date >= ? AND date < ? ORDER BY id",
+            (f'{year:04d}-01-01', f'{year + 1:04d}-01-01')
+        )
+        for sql in ARCHIVE_INDEXES:
+            conn.execute(sql)
+        conn.execute(
+            """
+            INSERT INTO main.category_totals (category_id, type, month, total, tx_count)
+            SELECT IFNULL(category_id, 0), type, substr(date, 1, 7), SUM(amount), COUNT(*)
+            FROM main.transactions GROUP BY 1, 2, 3
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO main.daily_totals (day, category_id, type, total, tx_count)
+            SELECT date, IFNULL(category_id, 0), type, SUM(amount), COUNT(*)
+            FROM main.transactions GROUP BY 1, 2, 3
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO main.transactions_fts (rowid, note, category)
+            SELECT t.id, IFNULL(t.note, ''), IFNULL(c.name, '')
+            FROM main.transactions t LEFT JOIN hot.categories c ON c.id = t.category_id
+            """
+        )
+        conn.execute("INSERT INTO main.transactions_fts (transactions_fts) VALUES ('optimize')")
+        conn.execute(
+            """
+            INSERT INTO main.archive_info (id, year, tx_count, balance, amount_sum, id_sum, first_date, last_date, created_at)
+            SELECT 1, ?, COUNT(*), IFNULL(SUM(CASE type WHEN 'Доход' THEN amount WHEN 'Трата' THEN -amount ELSE 0 END), 0),
+                   IFNULL(SUM(amount), 0), IFNULL(SUM(id), 0), MIN(date), MAX(date), ?
+            FROM main.transactions
+            """,
+            (year, datetime.now().isoformat(timespec='seconds'))
+        )
+        conn.execute(f"PRAGMA main.user_version = {ARCHIVE_FORMAT}")
+        conn.execute("ANALYZE main")
+        conn.execute("COMMIT")
+        conn.execute("DETACH DATABASE hot")
+        info = conn.execute("SELECT tx_count, balance, amount_sum, id_sum FROM archive_info").fetchone()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return info
+
+
+@instrumented
+def archive_year(year):
+    # переносит операции закрытого года в архив; вызывать не из другой транзакции.
+    # Строки удаляются при отложенных триггерах, поэтому сводные таблицы (а с ними баланс
+    # и отчёты) не меняются; место в файле основной базы освобождает vacuum()
+    year = int(year)
+    if year >= datetime.now().year:
+        raise ValueError(f'{year} год ещё не закрыт')
+    start, end = f'{year:04d}-01-01', f'{year + 1:04d}-01-01'
+    with get_conn() as conn:
+        if conn.execute("SELECT 1 FROM archives WHERE year=?", (year,)).fetchone():
+            raise ValueError(f'{year} год уже в архиве')
+        if len(conn.archives) >= conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+            raise ValueError('подключено предельное число архивов')
+        if not conn.execute("SELECT 1 FROM transactions WHERE date >= ? AND date < ? LIMIT 1", (start, end)).fetchone():
+            raise ValueError(f'за {year} год нет операций')
+    rel_path = os.path.join('archive', f'{Path(DB_PATH).stem}_{year}.db')
+    path = _archive_file(rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tx_count, balance, amount_sum, id_sum = _build_archive(path, year)
+    try:
+        with get_conn(write=True) as conn:
+            conn.execute("UPDATE balance_summary SET deferred = deferred + 1 WHERE id = 1")
+            # пока собирался файл, строки года могли измениться
+            current = conn.execute(
+                "SELECT COUNT(*), IFNULL(SUM(amount), 0), IFNULL(SUM(id), 0) FROM transactions WHERE date >= ? AND date < ?",
+                (start, end)
+            ).fetchone()
+            if tuple(current) != (tx_count, amount_sum, id_sum):
+                raise RuntimeError(f'операции за {year} год изменились во время архивации, повторите попытку')
+            conn.execute(
+                "DELETE FROM transactions_fts WHERE rowid IN (SELECT id FROM transactions WHERE date >= ? AND date < ?)",
+                (start, end)
+            )
+            conn.execute("DELETE FROM transactions WHERE date >= ? AND date < ?", (start, end))
+            # после массового удаления сегменты FTS5 полны отметок об удалении — поиск по основной
+            # базе замедляется в разы, пока их не слить
+            conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('optimize')")
+            conn.execute("UPDATE balance_summary SET deferred = deferred - 1, version = version + 1 WHERE id = 1")
+            conn.execute(
+                "INSERT INTO archives (year, path, tx_count, balance, created_at) VALUES (?,?,?,?,?)",
+                (year, rel_path, tx_count, balance, datetime.now().isoformat(timespec='seconds'))
+            )
+            conn.after_commit.append(_archives_changed)
+            _notify(conn, ChangeEvent(reset=True))
+    except BaseException:
+        os.remove(path)
+        raise
+    return {'year': year, 'path': path, 'tx_count': tx_count, 'balance': from_minor(balance)}
+
+
+@instrumented
+def get_archives():
+    with get_conn() as conn:
+        rows = conn.execute("SELECT year, path, tx_count, balance, created_at FROM archives ORDER BY year").fetchall()
+        attached = set(conn.archives)
+    return [
+        dict(r, path=_archive_file(r['path']), balance=from_minor(r['balance']), attached=r['year'] in attached)
+        for r in rows
+    ]
+
+
+@instrumented
+def archivable_years():
+    # закрытые годы с операциями в основной базе, ещё не перенесённые в архив
+    current = datetime.now().year
+    years = []
+    with get_conn() as conn:
+        archived = {r[0] for r in conn.execute("SELECT year FROM archives")}
+        day = conn.execute("SELECT MIN(date) FROM transactions").fetchone()[0]
+        while day and int(day[:4]) < current:
+            year = int(day[:4])
+            if year not in archived:
+                years.append(year)
+            # следующий год — поиском по индексу по дате, без просмотра строк
+            day = conn.execute(
+                "SELECT MIN(date) FROM transactions WHERE date >= ?", (f'{year + 1:04d}-01-01',)
+            ).fetchone()[0]
+    return years
+
+
+# планы запросов
+
+def explain_query_plan(sql, params=()):
+    with get_conn() as conn:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [r['detail'] for r in rows]
+
+
+# запросы, которые должны обходиться без полного сканирования и сортировки
+HOT_QUERIES = {
+    'transactions_page': (ALL_TX_SELECT + " ORDER BY t.date DESC, t.id DESC LIMIT 500", ()),
+    'transactions_page_after': (ALL_TX_SELECT + " WHERE (t.date, t.id) < (?, ?) ORDER BY t.date DESC, t.id DESC LIMIT 500", ('9999-12-31', 0)),
+    'transactions_by_category': ("SELECT id FROM transactions WHERE category_id=?", (0,)),
+    'expenses_by_date': ("SELECT date, amount FROM transactions WHERE type='Трата' ORDER BY date", ()),
+    'category_page': (ALL_TX_SELECT + " WHERE (t.category_id IN (?)) ORDER BY t.date DESC, t.id DESC LIMIT 500", (0,)),
+    'amount_page': (ALL_TX_SELECT + " ORDER BY t.amount DESC, t.id DESC LIMIT 500", ()),
+}
+
+
+def _explain_for_log(sql):
+    with get_conn() as conn:
+        return [r['detail'] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+instrument.set_explainer(_explain_for_log)
+
+
+def check_query_plans():
+    # возвращает список проблем; пустой список — все запросы используют индексы
+    problems = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        for detail in explain_query_plan(sql, params):
+            full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+            if full_scan or 'TEMP B-TREE' in detail:
+                problems.append(f'{name}: {detail}')
+    return problems
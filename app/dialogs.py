@@ -1,12 +1,15 @@
 import sys, os
 from PyQt5.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
-    QComboBox, QDateEdit, QRadioButton, QTextEdit, QFileDialog, QMessageBox
+    QComboBox, QDateEdit, QRadioButton, QTextEdit, QFileDialog, QMessageBox,
+    QCheckBox, QSpinBox, QTableWidget, QTableWidgetItem
 )
-from PyQt5.QtGui import QIcon, QDoubleValidator
+from PyQt5.QtGui import QDoubleValidator
 from PyQt5.QtCore import QDate
 from pathlib import Path
-from app.db import get_categories, add_category
+from app import instrument
+from app.db import get_categories, add_category, get_budgets, set_budget, delete_budget, BUDGET_PERIODS
+from app.icons import get_icon, icon_files
 
 
 def resource_path(relative_path):
@@ -146,18 +149,9 @@ class CategoryDialog(QDialog):
         self.setLayout(layout)
 
     def _load_icons(self):
-        icons_path = resource_path("images")
         self.icon_combo.addItem('Без иконки', userData=None)
-
-        if not os.path.exists(icons_path):
-            return
-
-        for file_name in os.listdir(icons_path):
-            if file_name.lower().endswith((".png")):
-                icon_path = os.path.join(icons_path, file_name)
-                icon = QIcon(icon_path)
-                name = os.path.splitext(file_name)[0].replace('_', ' ').title()
-                self.icon_combo.addItem(icon, name, userData=icon_path)
+        for name, icon_path in icon_files():
+            self.icon_combo.addItem(get_icon(icon_path), name, userData=icon_path)
 
     def save(self):
         name = self.name_input.text().strip()
@@ -166,4 +160,230 @@ class CategoryDialog(QDialog):
             QMessageBox.warning(self, 'Ошибка', 'Введите имя категории')
             return
         add_category(name, icon_path)
-        self.accept()
\ No newline at end of file
+        self.accept()
+
+
+class NoteReplaceDialog(QDialog):
+    # замена текста в заметках выделенных операций
+    def __init__(self, parent=None, count=0):
+        super().__init__(parent)
+        self.setWindowTitle('Замена в заметках')
+        layout = QVBoxLayout()
+
+        self.find_input = QLineEdit()
+        self.replace_input = QLineEdit()
+        layout.addWidget(QLabel(f'Выбрано операций: {count}'))
+        layout.addWidget(QLabel('Найти (с учётом регистра)'))
+        layout.addWidget(self.find_input)
+        layout.addWidget(QLabel('Заменить на'))
+        layout.addWidget(self.replace_input)
+
+        btns = QHBoxLayout()
+        ok = QPushButton('Заменить')
+        cancel = QPushButton('Отмена')
+        ok.clicked.connect(self.save)
+        cancel.clicked.connect(self.reject)
+        btns.addWidget(ok)
+        btns.addWidget(cancel)
+        layout.addLayout(btns)
+        self.setLayout(layout)
+
+    def save(self):
+        if not self.find_input.text():
+            QMessageBox.warning(self, 'Ошибка', 'Введите текст для поиска')
+            return
+        self.accept()
+
+    def get_data(self):
+        return self.find_input.text(), self.replace_input.text()
+
+
+BUDGET_PERIOD_NAMES = {'week': 'неделя', 'month': 'месяц', 'year': 'год'}
+
+
+class BudgetDialog(QDialog):
+    # лимиты трат по категориям; потраченное показывается за текущий период
+    COLUMNS = ['Категория', 'Период', 'Лимит', 'Потрачено', '%']
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Бюджеты')
+        self.resize(600, 400)
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.itemSelectionChanged.connect(self._fill_form)
+        layout.addWidget(self.table)
+
+        form = QHBoxLayout()
+        self.category_combo = QComboBox()
+        for c in get_categories():
+            self.category_combo.addItem(c['name'], c['id'])
+        self.period_combo = QComboBox()
+        for period in BUDGET_PERIODS:
+            self.period_combo.addItem(BUDGET_PERIOD_NAMES[period], period)
+        self.period_combo.setCurrentIndex(BUDGET_PERIODS.index('month'))
+        self.amount_input = QLineEdit()
+        self.amount_input.setPlaceholderText('Лимит')
+        self.amount_input.setValidator(QDoubleValidator(0, 1e12, 2, self.amount_input))
+        self.threshold = QSpinBox()
+        self.threshold.setRange(1, 100)
+        self.threshold.setSuffix(' %')
+        self.threshold.setValue(80)
+        self.threshold.setToolTip('Предупреждать, когда потрачено столько от лимита')
+        form.addWidget(self.category_combo)
+        form.addWidget(self.period_combo)
+        form.addWidget(self.amount_input)
+        form.addWidget(QLabel('предупреждать с'))
+        form.addWidget(self.threshold)
+        layout.addLayout(form)
+
+        btns = QHBoxLayout()
+        save = QPushButton('Сохранить')
+        delete = QPushButton('Удалить')
+        close = QPushButton('Закрыть')
+        save.clicked.connect(self.save)
+        delete.clicked.connect(self.delete)
+        close.clicked.connect(self.accept)
+        btns.addWidget(save)
+        btns.addWidget(delete)
+        btns.addStretch()
+        btns.addWidget(close)
+        layout.addLayout(btns)
+        self.setLayout(layout)
+
+        self.refresh()
+
+    def refresh(self):
+        self._budgets = get_budgets()
+        self.table.setRowCount(len(self._budgets))
+        for row, b in enumerate(self._budgets):
+            values = [b['category_name'], BUDGET_PERIOD_NAMES[b['period']], f"{b['amount']:.2f}",
+                      f"{b['spent']:.2f}", f"{b['ratio'] * 100:.0f}"]
+            for col, v in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(v))
+
+    def _selected(self):
+        row = self.table.currentRow()
+        return self._budgets[row] if 0 <= row < len(self._budgets) else None
+
+    def _fill_form(self):
+        b = self._selected()
+        if b is None:
+            return
+        self.category_combo.setCurrentIndex(max(self.category_combo.findData(b['category_id']), 0))
+        self.period_combo.setCurrentIndex(BUDGET_PERIODS.index(b['period']))
+        self.amount_input.setText(f"{b['amount']:.2f}")
+        self.threshold.setValue(round(b['threshold'] * 100))
+
+    def save(self):
+        text = self.amount_input.text().strip().replace(',', '.')
+        try:
+            amount = float(text)
+        except ValueError:
+            amount = 0
+        if self.category_combo.currentData() is None:
+            QMessageBox.warning(self, 'Ошибка', 'Сначала добавьте категорию')
+            return
+        if amount <= 0:
+            QMessageBox.warning(self, 'Ошибка', 'Введите лимит больше нуля')
+            return
+        set_budget(self.category_combo.currentData(), self.period_combo.currentData(), amount,
+                   self.threshold.value() / 100)
+        self.refresh()
+
+    def delete(self):
+        b = self._selected()
+        if b is not None:
+            delete_budget(b['id'])
+            self.refresh()
+
+
+class QueryStatsDialog(QDialog):
+    # отладочное окно со статистикой вызовов app.db (F12 в главном окне)
+    COLUMNS = ['Функция', 'Вызовов', 'Всего, мс', 'Средн., мс', 'Макс., мс', 'Строк', 'Медленных']
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Статистика запросов')
+        self.resize(800, 500)
+        layout = QVBoxLayout()
+
+        top = QHBoxLayout()
+        self.enabled_check = QCheckBox('Сбор статистики')
+        self.enabled_check.setChecked(instrument.is_enabled())
+        self.enabled_check.toggled.connect(self._toggle)
+        self.threshold = QSpinBox()
+        self.threshold.setRange(1, 60000)
+        self.threshold.setSuffix(' мс')
+        self.threshold.setValue(int(instrument.slow_threshold_ms))
+        top.addWidget(self.enabled_check)
+        top.addWidget(QLabel('Порог медленного вызова'))
+        top.addWidget(self.threshold)
+        top.addStretch()
+        layout.addLayout(top)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.itemSelectionChanged.connect(self._show_sql)
+        layout.addWidget(self.table, 2)
+
+        self.details = QTextEdit()
+        self.details.setReadOnly(True)
+        layout.addWidget(self.details, 1)
+
+        btns = QHBoxLayout()
+        refresh = QPushButton('Обновить')
+        reset = QPushButton('Сбросить')
+        close = QPushButton('Закрыть')
+        refresh.clicked.connect(self.refresh)
+        reset.clicked.connect(self._reset)
+        close.clicked.connect(self.accept)
+        btns.addWidget(refresh)
+        btns.addWidget(reset)
+        btns.addStretch()
+        btns.addWidget(close)
+        layout.addLayout(btns)
+        self.setLayout(layout)
+
+        self.refresh()
+
+    def _toggle(self, on):
+        if on:
+            instrument.enable(self.threshold.value())
+        else:
+            instrument.disable()
+
+    def _reset(self):
+        instrument.reset()
+        self.refresh()
+
+    def refresh(self):
+        if instrument.is_enabled():
+            instrument.slow_threshold_ms = float(self.threshold.value())
+        self._stats = instrument.get_stats()
+        self.table.setRowCount(len(self._stats))
+        for row, st in enumerate(self._stats):
+            values = [st['name'], st['calls'], f"{st['total_ms']:.1f}", f"{st['avg_ms']:.2f}",
+                      f"{st['max_ms']:.1f}", st['rows'], st['slow']]
+            for col, v in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(str(v)))
+        self._show_slow()
+
+    def _show_sql(self):
+        row = self.table.currentRow()
+        if 0 <= row < len(self._stats):
+            self.details.setPlainText('\n\n'.join(self._stats[row]['last_sql']))
+
+    def _show_slow(self):
+        lines = []
+        for q in reversed(instrument.slow_queries()):
+            lines.append(f"{q['name']}: {q['ms']:.1f} мс, строк: {q['rows']}")
+            for sql, plan in q['plans']:
+                lines.append('  ' + sql)
+                lines.extend('    ' + p for p in plan)
+        self.details.setPlainText('\n'.join(lines) if lines else 'Медленных вызовов нет')
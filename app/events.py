@@ -0,0 +1,35 @@
+import logging
+from dataclasses import dataclass, field
+
+log = logging.getLogger(__name__)
+
+_listeners = []
+
+
+@dataclass
+class ChangeEvent:
+    # строки приходят в том же виде, что и из get_transactions_page
+    inserted: list = field(default_factory=list)
+    updated: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)  # id удалённых транзакций
+    balance_delta: float = 0.0
+    expense_deltas: dict = field(default_factory=dict)  # имя категории -> изменение суммы трат
+    reset: bool = False  # изменилось слишком много, нужно перечитать всё
+
+
+def subscribe(callback):
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def unsubscribe(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def emit(event):
+    for cb in list(_listeners):
+        try:
+            cb(event)
+        except Exception:
+            log.exception('change listener failed')
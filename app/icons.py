@@ -0,0 +1,35 @@
+import sys, os
+from functools import lru_cache
+
+from PyQt5.QtGui import QIcon
+
+
+def resource_path(relative_path):
+    if hasattr(sys, "_MEIPASS"):
+        return os.path.join(sys._MEIPASS, relative_path)
+    return os.path.join(os.path.abspath("."), relative_path)
+
+
+# общий для всего процесса кэш: каждая иконка загружается один раз
+_icons = {}
+
+
+def get_icon(path):
+    icon = _icons.get(path)
+    if icon is None:
+        icon = _icons[path] = QIcon(path)
+    return icon
+
+
+@lru_cache(maxsize=None)
+def icon_files():
+    # список (название, путь) для иконок из папки images
+    icons_path = resource_path("images")
+    if not os.path.exists(icons_path):
+        return ()
+    files = []
+    for file_name in sorted(os.listdir(icons_path)):
+        if file_name.lower().endswith(".png"):
+            name = os.path.splitext(file_name)[0].replace('_', ' ').title()
+            files.append((name, os.path.join(icons_path, file_name)))
+    return tuple(files)
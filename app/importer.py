@@ -0,0 +1,304 @@
+import os
+import csv
+import gzip
+import hashlib
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date as _date, datetime
+from decimal import Decimal, DecimalException, ROUND_HALF_UP
+from pathlib import Path
+
+from app.db import (
+    get_conn, deferred_aggregates, clear_transactions, add_parsed_transactions, known_files, record_import,
+    row_digest, occurrence_hash, MINOR_UNITS, DEFAULT_CURRENCY
+)
+
+# импорт выписок: файлы читаются кусками, разбор и проверка строк идут в пуле процессов,
+# в базу пишет один поток (add_parsed_transactions) в исходном порядке строк.
+# Режимы: replace — заменить все операции, merge — добавить только новые строки
+# (по отпечатку row_hash); файлы, уже загруженные ранее, в режиме merge не читаются
+
+CHUNK_ROWS = 20000
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%Y/%m/%d', '%d-%m-%Y', '%d.%m.%y')
+TYPES = {
+    'доход': 'Доход', 'income': 'Доход', 'приход': 'Доход',
+    'трата': 'Трата', 'расход': 'Трата', 'expense': 'Трата',
+}
+DEFAULT_CATEGORY = 'Без категории'
+REJECT_SAMPLES = 100
+
+
+def collect_files(paths):
+    # файлы и папки (в папке берутся *.csv и *.csv.gz) -> отсортированный список файлов
+    files = []
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            files += sorted(f for f in p.iterdir() if f.name.lower().endswith(('.csv', '.csv.gz')))
+        else:
+            files.append(p)
+    return [str(f) for f in files]
+
+
+def file_fingerprint(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _open_input(path):
+    # utf-8-sig: Excel в «CSV UTF-8» пишет BOM перед заголовком
+    if str(path).lower().endswith('.gz'):
+        return gzip.open(path, 'rt', newline='', encoding='utf-8-sig')
+    return open(path, newline='', encoding='utf-8-sig')
+
+
+def parse_date(text, formats=DATE_FORMATS):
+    # если formats — список, сработавший формат переставляется в начало:
+    # в одном файле он обычно один и тот же
+    text = text.strip()
+    # время после даты отбрасываем: «2024-01-31 12:00:00», «2024-01-31T12:00»
+    for sep in ('T', ' '):
+        if sep in text:
+            text = text.split(sep, 1)[0]
+    if len(text) == 10 and text[4] == '-':
+        # ISO — самый частый случай, fromisoformat намного быстрее strptime
+        try:
+            return _date.fromisoformat(text).isoformat()
+        except ValueError:
+            pass
+    for i, fmt in enumerate(formats):
+        try:
+            d = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if i and isinstance(formats, list):
+            formats.insert(0, formats.pop(i))
+        return d.date().isoformat()
+    raise ValueError(f'неизвестный формат даты: {text!r}')
+
+
+def parse_amount(text):
+    # «1 234,56», «-1234.56», «1234» -> (модуль в минимальных единицах, отрицательная ли)
+    t = text.strip().replace('\xa0', '').replace(' ', '').replace(',', '.')
+    negative = t.startswith('-')
+    whole, _, frac = t.lstrip('+-').partition('.')
+    if whole.isascii() and whole.isdigit() and len(frac) <= 2 and (not frac or frac.isdigit()):
+        # обычная запись с копейками — без Decimal
+        minor = int(whole) * MINOR_UNITS + int(frac.ljust(2, '0')) * MINOR_UNITS // 100
+        negative = negative and minor > 0
+    else:
+        # ошибки Decimal (в том числе переполнение при quantize у «1e30») — ArithmeticError
+        try:
+            value = Decimal(t)
+            if not value.is_finite():
+                raise ValueError(f'не число: {text!r}')
+            minor = int((value * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        except DecimalException:
+            raise ValueError(f'не число: {text!r}')
+        minor, negative = abs(minor), minor < 0
+    # столбец amount — 64-битное целое SQLite
+    if minor >= 2 ** 63:
+        raise ValueError(f'слишком большая сумма: {text!r}')
+    return minor, negative
+
+
+def _columns(header):
+    # индексы нужных столбцов по заголовку файла
+    names = [h.strip().lower() for h in header]
+
+    def find(*keys):
+        for k in keys:
+            if k in names:
+                return names.index(k)
+        return None
+
+    return {
+        'date': find('date'),
+        'amount': find('amount'),
+        'type': find('type'),
+        'category': find('category_name', 'category'),
+        'note': find('note'),
+        'currency': find('currency'),
+    }
+
+
+def parse_chunk(source, header, rows):
+    # выполняется в процессе пула; rows — пары (номер строки, список полей)
+    # -> (кортежи для add_parsed_transactions, отбракованные (файл, строка, причина, поля))
+    cols = _columns(header)
+    formats = list(DATE_FORMATS)
+    good, rejects = [], []
+
+    def get(fields, key):
+        i = cols[key]
+        return fields[i] if i is not None and i < len(fields) else ''
+
+    for line, fields in rows:
+        try:
+            date = parse_date(get(fields, 'date'), formats)
+            amount, negative = parse_amount(get(fields, 'amount'))
+            raw_type = get(fields, 'type').strip()
+            if raw_type:
+                ttype = TYPES.get(raw_type.lower())
+                if ttype is None:
+                    raise ValueError(f'неизвестный тип операции: {raw_type!r}')
+            else:
+                # банковские выписки без типа: списания отрицательные
+                ttype = 'Трата' if negative else 'Доход'
+            currency = get(fields, 'currency').strip().upper() or DEFAULT_CURRENCY
+            if len(currency) != 3 or not currency.isalpha():
+                raise ValueError(f'неверный код валюты: {currency!r}')
+            category = get(fields, 'category').strip() or DEFAULT_CATEGORY
+            note = get(fields, 'note')
+            # последний элемент — отпечаток содержимого; номер повтора добавит _with_hashes
+            good.append((date, amount, currency, ttype, category, note,
+                         row_digest(date, amount, ttype, category, note)))
+        except ValueError as e:
+            rejects.append((source, line, str(e), fields))
+    return good, rejects
+
+
+def _read_chunks(path, chunk_rows):
+    # (заголовок, строки) кусками; разбор CSV — в C, поэтому чтение не узкое место
+    with _open_input(path) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        chunk = []
+        for fields in reader:
+            if not fields:
+                continue
+            chunk.append((reader.line_num, fields))
+            if len(chunk) >= chunk_rows:
+                yield header, chunk
+                chunk = []
+        if chunk:
+            yield header, chunk
+
+
+def _tasks(files, chunk_rows, on_rejects):
+    for path in files:
+        for header, rows in _read_chunks(path, chunk_rows):
+            cols = _columns(header)
+            if cols['date'] is None or cols['amount'] is None:
+                on_rejects([(path, 1, 'нет столбцов date и amount', header)])
+                break
+            yield path, header, rows
+
+
+def _take(pending, on_rejects):
+    source, future = pending.popleft()
+    good, rejects = future.result()
+    on_rejects(rejects)
+    return source, good
+
+
+def _parsed(files, workers, chunk_rows, on_rejects):
+    # результаты разбора в порядке файлов и строк; пул запускается,
+    # только если данных больше одного куска
+    tasks = _tasks(files, chunk_rows, on_rejects)
+    head = list(itertools.islice(tasks, 2))
+    if len(head) < 2 or workers <= 1:
+        for task in itertools.chain(head, tasks):
+            good, rejects = parse_chunk(*task)
+            on_rejects(rejects)
+            yield task[0], good
+        return
+    # spawn: безопасно при запуске из рабочего потока GUI и в сборке PyInstaller
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending = deque()
+        try:
+            for task in itertools.chain(head, tasks):
+                pending.append((task[0], pool.submit(parse_chunk, *task)))
+                # не больше двух кусков на процесс в очереди — память не растёт с размером файлов
+                while len(pending) > workers * 2:
+                    yield _take(pending, on_rejects)
+            while pending:
+                yield _take(pending, on_rejects)
+        finally:
+            for _, f in pending:
+                f.cancel()
+
+
+def _with_hashes(parsed, rows_per_file):
+    # отпечаток + номер повтора одинаковых строк внутри файла -> row_hash;
+    # так две одинаковые покупки за день остаются двумя строками, а пересекающиеся
+    # выписки (один и тот же день в двух файлах) не дублируют операции
+    current, seen = None, {}
+    for source, good in parsed:
+        if source != current:
+            current, seen = source, {}
+        rows_per_file[source] = rows_per_file.get(source, 0) + len(good)
+        batch = []
+        for *row, digest in good:
+            k = seen.get(digest, 0)
+            seen[digest] = k + 1
+            batch.append((*row, occurrence_hash(digest, k)))
+        yield batch
+
+
+def import_files(paths, mode='replace', progress=None, reject_path=None, workers=None, chunk_rows=CHUNK_ROWS):
+    # paths — файлы и/или папки; плохие строки не прерывают импорт, а попадают в отчёт
+    # (reject_path — CSV со столбцами file, line, error, fields)
+    if mode not in ('replace', 'merge'):
+        raise ValueError(f'неизвестный режим импорта: {mode}')
+    started_at = datetime.now().isoformat(timespec='seconds')
+    fingerprints = {}
+    for path in collect_files(paths):
+        fingerprints.setdefault(file_fingerprint(path), path)
+    known = known_files(fingerprints) if mode == 'merge' else set()
+    files = [path for sha, path in fingerprints.items() if sha not in known]
+    workers = workers or os.cpu_count() or 1
+    result = {
+        'files': len(files), 'skipped_files': len(fingerprints) - len(files),
+        'imported': 0, 'skipped': 0, 'rejected': 0, 'rejects': [], 'reject_path': None,
+    }
+    if not files and mode == 'merge':
+        # все файлы уже загружены — ничего не читаем
+        return result
+    report = writer = None
+    if reject_path:
+        report = open(reject_path, 'w', newline='', encoding='utf-8')
+        writer = csv.writer(report)
+        writer.writerow(['file', 'line', 'error', 'fields'])
+        result['reject_path'] = reject_path
+
+    def on_rejects(rejects):
+        result['rejected'] += len(rejects)
+        room = REJECT_SAMPLES - len(result['rejects'])
+        if room > 0:
+            result['rejects'] += rejects[:room]
+        if writer:
+            writer.writerows((src, line, err, ','.join(fields)) for src, line, err, fields in rejects)
+
+    rows_per_file = {}
+    # replace пересчитывает сводные таблицы один раз в конце; merge добавляет немного строк,
+    # и триггеры обновляют сводки только на них — цена зависит от объёма новых данных
+    try:
+        with deferred_aggregates() if mode == 'replace' else get_conn(write=True):
+            if mode == 'replace':
+                clear_transactions()
+            result['imported'] = add_parsed_transactions(
+                _with_hashes(_parsed(files, workers, chunk_rows, on_rejects), rows_per_file),
+                progress=progress
+            )
+            result['skipped'] = sum(rows_per_file.values()) - result['imported']
+            # файлы без единой разобранной строки (например, с неверным заголовком) не запоминаются:
+            # исправленный файл с тем же содержимым можно будет загрузить снова
+            record_import(
+                mode, started_at,
+                [(sha, path, os.path.getsize(path), rows_per_file[path])
+                 for sha, path in fingerprints.items() if sha not in known and rows_per_file.get(path)],
+                result['imported'], result['skipped'], result['rejected']
+            )
+    finally:
+        if report:
+            report.close()
+    return result
@@ -0,0 +1,198 @@
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Sequence
+
+from app.pool import ConnectionPool
+
+# сбор статистики вызовов app.db; выключен по умолчанию и тогда стоит
+# одну проверку флага на вызов
+
+log = logging.getLogger('app.db.slow')
+
+_enabled = bool(os.environ.get('FINANCE_DB_PROFILE'))
+slow_threshold_ms = float(os.environ.get('FINANCE_DB_SLOW_MS', 100))
+
+_stats = {}
+_slow = deque(maxlen=100)
+_lock = threading.Lock()
+_local = threading.local()
+_explainer = None
+
+_SKIP_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA', 'EXPLAIN', '--')
+
+
+def _on_sql(statement):
+    # вызывается sqlite для каждого выполненного запроса
+    stack = getattr(_local, 'stack', None)
+    if stack and not getattr(_local, 'explaining', False):
+        s = statement.strip()
+        sqls = stack[-1]
+        # при срабатывании триггеров sqlite сообщает тот же запрос повторно
+        if not s.upper().startswith(_SKIP_PREFIXES) and (not sqls or sqls[-1] != s):
+            sqls.append(s)
+
+
+def enable(threshold_ms=None):
+    global _enabled, slow_threshold_ms
+    if threshold_ms is not None:
+        slow_threshold_ms = float(threshold_ms)
+    _enabled = True
+    ConnectionPool.trace_callback = _on_sql
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    ConnectionPool.trace_callback = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_explainer(fn):
+    # fn(sql) -> список строк плана; регистрирует app.db
+    global _explainer
+    _explainer = fn
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _slow.clear()
+
+
+def get_stats():
+    with _lock:
+        items = [dict(name=name, **st) for name, st in _stats.items()]
+    for it in items:
+        it['avg_ms'] = it['total_ms'] / it['calls'] if it['calls'] else 0.0
+        it['last_sql'] = list(it['last_sql'])
+    items.sort(key=lambda it: it['total_ms'], reverse=True)
+    return items
+
+
+def slow_queries():
+    with _lock:
+        return list(_slow)
+
+
+def _count_rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, Sequence):
+        return len(result)
+    return 1
+
+
+def _explain(sqls):
+    if _explainer is None:
+        return []
+    plans = []
+    _local.explaining = True
+    try:
+        for sql in sqls:
+            try:
+                plans.append((sql, _explainer(sql)))
+            except Exception as e:
+                plans.append((sql, [f'не удалось получить план: {e}']))
+    finally:
+        _local.explaining = False
+    return plans
+
+
+def _record(name, elapsed, rows, sqls):
+    ms = elapsed * 1000
+    with _lock:
+        st = _stats.get(name)
+        if st is None:
+            st = _stats[name] = dict(calls=0, total_ms=0.0, max_ms=0.0, rows=0, slow=0, last_sql=())
+        st['calls'] += 1
+        st['total_ms'] += ms
+        st['max_ms'] = max(st['max_ms'], ms)
+        st['rows'] += rows
+        if sqls:
+            st['last_sql'] = tuple(sqls)
+        if ms >= slow_threshold_ms:
+            st['slow'] += 1
+    if ms >= slow_threshold_ms:
+        plans = _explain(sqls)
+        with _lock:
+            _slow.append(dict(name=name, ms=ms, rows=rows, time=time.time(), plans=plans))
+        log.warning('медленный вызов %s: %.1f мс, строк: %d\n%s', name, ms, rows,
+                    '\n'.join(f'{sql}\n    ' + '\n    '.join(plan) for sql, plan in plans))
+
+
+def _begin():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    sqls = []
+    stack.append(sqls)
+    return stack, sqls
+
+
+def _end(stack, sqls):
+    stack.pop()
+    if stack:
+        # запросы вложенного вызова относятся и к внешнему
+        stack[-1].extend(sqls)
+
+
+def instrumented(fn):
+    name = fn.__name__
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def gen_wrapper(*args, **kwargs):
+            if not _enabled:
+                yield from fn(*args, **kwargs)
+                return
+            rows = 0
+            elapsed = 0.0
+            last = []
+            it = fn(*args, **kwargs)
+            try:
+                while True:
+                    # время считаем только внутри генератора, без работы потребителя
+                    stack, sqls = _begin()
+                    t = time.perf_counter()
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - t
+                        _end(stack, sqls)
+                        if sqls:
+                            last = sqls
+                    rows += 1
+                    yield item
+            finally:
+                it.close()
+                _record(name, elapsed, rows, last)
+        return gen_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return fn(*args, **kwargs)
+        stack, sqls = _begin()
+        t = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - t
+            _end(stack, sqls)
+        _record(name, elapsed, _count_rows(result), sqls)
+        return result
+    return wrapper
+
+
+if _enabled:
+    enable()
@@ -1,55 +1,92 @@
-import sys, os
+import sys, os, time
+import multiprocessing
+_STARTUP = [('старт', time.perf_counter())]
+
+
+def _mark(label):
+    _STARTUP.append((label, time.perf_counter()))
+
+
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton,
-    QHBoxLayout, QTableWidget, QTableWidgetItem, QFileDialog, QMessageBox, QDialog
+    QHBoxLayout, QTableView, QFileDialog, QMessageBox, QDialog,
+    QProgressDialog, QShortcut, QLineEdit, QComboBox, QDateEdit
 )
-from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QKeySequence, QDoubleValidator
+from PyQt5.QtCore import Qt, QTimer, QDate, pyqtSignal
 from pathlib import Path
-
-from app.db import init_db, get_balance, get_transactions, get_expenses_by_category, add_transaction, delete_transaction, clear_database
-from app.dialogs import TransactionDialog, CategoryDialog
-from app.utils import export_csv, import_csv
-
-# matplotlib integration
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
+_mark('импорт PyQt5')
+
+from app.db import (
+    init_db, get_balance, get_transaction, get_transactions_page, get_expenses_by_category,
+    add_transaction, delete_transaction, clear_database, close_pool, search_transactions,
+    query_transactions, get_categories, TransactionFilter, archive_year, archivable_years, get_archives, vacuum,
+    delete_transactions, set_transactions_category, set_transactions_type, replace_in_notes, undo_bulk,
+    last_bulk_action, get_budgets
+)
+from app import events
+from app.dialogs import (
+    TransactionDialog, CategoryDialog, QueryStatsDialog, NoteReplaceDialog, BudgetDialog, BUDGET_PERIOD_NAMES
+)
+from app.icons import get_icon
+from app.models import TransactionTableModel
+from app.importer import import_files
+from app.utils import export_csv
+from app.workers import TaskRunner
+_mark('импорт модулей app')
 
 def resource_path(relative_path):
     if hasattr(sys, "_MEIPASS"):
         return os.path.join(sys._MEIPASS, relative_path)
     return os.path.join(os.path.abspath("."), relative_path)
 
-class PieCanvas(FigureCanvas):
-    def __init__(self, parent=None, width=4, height=3, dpi=100):
-        fig = Figure(figsize=(width, height), dpi=dpi)
-        self.ax = fig.add_subplot(111)
-        super().__init__(fig)
-        self.setParent(parent)
-
-    def plot(self, data):
-        self.ax.clear()
-        if not data:
-            self.ax.text(0.5, 0.5, 'Нет данных', ha='center')
-            self.draw()
-            return
-        labels = [d['name'] for d in data]
-        sizes = [d['total'] for d in data]
-        self.ax.pie(sizes, labels=labels, autopct='%1.1f%%')
-        self.ax.axis('equal')
-        self.draw()
+
+def load_trend():
+    # numpy грузится в фоновом потоке, а не при запуске
+    from app.reports import period_report
+    return period_report('month')
+
+
+def archive_and_vacuum(year):
+    # после переноса года основная база сжимается — ради этого архив и нужен
+    result = archive_year(year)
+    vacuum()
+    return result
+
+
+def clear_and_init():
+    clear_database()
+    init_db()  # пересоздаст таблицы, если они были удалены или были пустыми
+
+
+def load_snapshot(page_size):
+    # выполняется в фоновом потоке
+    return dict(
+        balance=get_balance(),
+        page=get_transactions_page(limit=page_size),
+        expenses=get_expenses_by_category(),
+        trend=load_trend(),
+        budgets=get_budgets(),
+    )
 
 
 class MainWindow(QMainWindow):
+    # события базы могут приходить из рабочих потоков — доставляем их в GUI-поток
+    db_changed = pyqtSignal(object)
+    chart_ready = pyqtSignal()
+
     def __init__(self):
         super().__init__()
-        self.setWindowIcon(QIcon(resource_path("images/app_icon.png")))
+        self.setWindowIcon(get_icon(resource_path("images/app_icon.png")))
         self.setWindowTitle('Finance Tracker')
         self.resize(900,600)
         init_db()
+        self.runner = TaskRunner(self)
+        self._balance = 0.0
+        self._budget_status = None  # id бюджета -> status при последней проверке
 
         central = QWidget()
         layout = QVBoxLayout()
@@ -57,7 +94,23 @@ class MainWindow(QMainWindow):
         top = QHBoxLayout()
         self.balance_label = QLabel('Баланс: 0.00')
         top.addWidget(self.balance_label)
+        self.budget_label = QLabel()
+        self.budget_label.setStyleSheet('color: #c62828')
+        self.budget_label.hide()
+        top.addWidget(self.budget_label)
         top.addStretch()
+        # поиск по мере ввода: запрос уходит после паузы в наборе
+        self.search = QLineEdit()
+        self.search.setPlaceholderText('Поиск по заметкам и категориям')
+        self.search.setClearButtonEnabled(True)
+        self._custom_view = False
+        self._view_fetch = None
+        self._view_timer = QTimer(self)
+        self._view_timer.setSingleShot(True)
+        self._view_timer.setInterval(250)
+        self._view_timer.timeout.connect(self.update_view)
+        self.search.textChanged.connect(self._view_timer.start)
+        top.addWidget(self.search)
         add_btn = QPushButton('Добавить')
         add_btn.clicked.connect(self.add_transaction)
         cat_btn = QPushButton('Категории')
@@ -66,6 +119,10 @@ class MainWindow(QMainWindow):
         imp_btn.clicked.connect(self.import_csv)
         exp_btn = QPushButton('Экспорт CSV')
         exp_btn.clicked.connect(self.export_csv)
+        budget_btn = QPushButton('Бюджеты')
+        budget_btn.clicked.connect(self.budgets_dialog)
+        arch_btn = QPushButton('Архив')
+        arch_btn.clicked.connect(self.archive_dialog)
         clear_db_btn = QPushButton('Очистить')
         clear_db_btn.clicked.connect(self.clear_database_dialog)
         top.addWidget(clear_db_btn)
@@ -73,18 +130,32 @@ class MainWindow(QMainWindow):
         top.addWidget(cat_btn)
         top.addWidget(imp_btn)
         top.addWidget(exp_btn)
+        top.addWidget(budget_btn)
+        top.addWidget(arch_btn)
 
         layout.addLayout(top)
+        layout.addLayout(self._build_filters())
 
         mid = QHBoxLayout()
-        self.table = QTableWidget(0,6)
-        self.table.setHorizontalHeaderLabels(['ID','Дата','Сумма','Тип','Категория','Примечание'])
+        self.model = TransactionTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QTableView.SelectRows)
+        self.table.setSelectionMode(QTableView.ExtendedSelection)
+        self.table.setEditTriggers(QTableView.NoEditTriggers)
         self.table.setColumnHidden(0, True)
-        self.table.cellDoubleClicked.connect(self.edit_transaction)
+        self.table.doubleClicked.connect(self.edit_transaction)
         mid.addWidget(self.table, 2)
 
-        self.pie = PieCanvas(self, width=4, height=3)
-        mid.addWidget(self.pie, 1)
+        # диаграммы создаются после первой отрисовки окна (см. showEvent)
+        self.pie = None
+        self.trend = None
+        self._expenses = []
+        self._trend = None
+        self.charts = QVBoxLayout()
+        self.pie_slot = QWidget()
+        self.charts.addWidget(self.pie_slot, 1)
+        mid.addLayout(self.charts, 1)
 
         layout.addLayout(mid)
         central.setLayout(layout)
@@ -93,90 +164,475 @@ class MainWindow(QMainWindow):
         # контекстное меню
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self.on_table_context)
+        QShortcut(QKeySequence.Delete, self.table, activated=self.delete_selected, context=Qt.WidgetShortcut)
+        QShortcut(QKeySequence.Undo, self.table, activated=self.undo_bulk_action, context=Qt.WidgetShortcut)
 
+        # отладка: статистика запросов к базе
+        QShortcut(QKeySequence('F12'), self, activated=self.show_query_stats)
+
+        self._emit_change = self.db_changed.emit
+        self.db_changed.connect(self.on_db_change)
+        events.subscribe(self._emit_change)
         self.refresh()
 
+    def _build_filters(self):
+        # фильтры выполняются запросом к базе (query_transactions), а не в Python
+        row = QHBoxLayout()
+        self.f_from = self._date_filter()
+        self.f_to = self._date_filter()
+        self.f_type = QComboBox()
+        self.f_type.addItem('Все типы', None)
+        self.f_type.addItem('Доход', 'Доход')
+        self.f_type.addItem('Трата', 'Трата')
+        self.f_category = QComboBox()
+        self._fill_category_filter()
+        self.f_min = QLineEdit()
+        self.f_min.setPlaceholderText('Сумма от')
+        self.f_max = QLineEdit()
+        self.f_max.setPlaceholderText('до')
+        for edit in (self.f_min, self.f_max):
+            edit.setValidator(QDoubleValidator(0, 1e12, 2, edit))
+            edit.setMaximumWidth(90)
+            edit.textChanged.connect(self._view_timer.start)
+        self.f_sort = QComboBox()
+        self.f_sort.addItem('Сначала новые', ('date', True))
+        self.f_sort.addItem('Сначала старые', ('date', False))
+        self.f_sort.addItem('Сумма по убыванию', ('amount', True))
+        self.f_sort.addItem('Сумма по возрастанию', ('amount', False))
+        for combo in (self.f_type, self.f_category, self.f_sort):
+            combo.currentIndexChanged.connect(self._view_timer.start)
+        reset_btn = QPushButton('Сбросить')
+        reset_btn.clicked.connect(self.reset_filters)
+
+        row.addWidget(QLabel('С'))
+        row.addWidget(self.f_from)
+        row.addWidget(QLabel('по'))
+        row.addWidget(self.f_to)
+        row.addWidget(self.f_type)
+        row.addWidget(self.f_category)
+        row.addWidget(self.f_min)
+        row.addWidget(self.f_max)
+        row.addWidget(self.f_sort)
+        row.addWidget(reset_btn)
+        row.addStretch()
+        return row
+
+    def _date_filter(self):
+        # минимальная дата означает «не задано»
+        edit = QDateEdit()
+        edit.setCalendarPopup(True)
+        edit.setDisplayFormat('yyyy-MM-dd')
+        edit.setMinimumDate(QDate(1900, 1, 1))
+        edit.setSpecialValueText('—')
+        edit.setDate(edit.minimumDate())
+        edit.dateChanged.connect(self._view_timer.start)
+        return edit
+
+    def _fill_category_filter(self):
+        current = self.f_category.currentData()
+        self.f_category.blockSignals(True)
+        self.f_category.clear()
+        self.f_category.addItem('Все категории', None)
+        self.f_category.addItem('Без категории', [None])
+        for c in get_categories():
+            self.f_category.addItem(c['name'], [c['id']])
+        i = self.f_category.findData(current)
+        self.f_category.setCurrentIndex(max(i, 0))
+        self.f_category.blockSignals(False)
+
+    def current_filter(self):
+        def date(edit):
+            d = edit.date()
+            return None if d == edit.minimumDate() else d.toString('yyyy-MM-dd')
+
+        def amount(edit):
+            text = edit.text().replace(',', '.').strip()
+            try:
+                return float(text) if text else None
+            except ValueError:
+                return None
+
+        sort, descending = self.f_sort.currentData()
+        return TransactionFilter(
+            date_from=date(self.f_from), date_to=date(self.f_to),
+            ttype=self.f_type.currentData(), category_ids=self.f_category.currentData(),
+            amount_min=amount(self.f_min), amount_max=amount(self.f_max),
+            sort=sort, descending=descending,
+        )
+
+    def reset_filters(self):
+        for w in (self.f_from, self.f_to, self.f_type, self.f_category, self.f_min, self.f_max, self.f_sort, self.search):
+            w.blockSignals(True)
+        self.f_from.setDate(self.f_from.minimumDate())
+        self.f_to.setDate(self.f_to.minimumDate())
+        for combo in (self.f_type, self.f_category, self.f_sort):
+            combo.setCurrentIndex(0)
+        for edit in (self.f_min, self.f_max, self.search):
+            edit.clear()
+        for w in (self.f_from, self.f_to, self.f_type, self.f_category, self.f_min, self.f_max, self.f_sort, self.search):
+            w.blockSignals(False)
+        self.update_view()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.pie is None:
+            QTimer.singleShot(0, self._init_chart)
+
+    def _init_chart(self):
+        if self.pie is not None:
+            return
+        from app.charts import PieCanvas, TrendCanvas
+        self.pie = PieCanvas(self, width=4, height=3)
+        self.charts.replaceWidget(self.pie_slot, self.pie)
+        self.pie_slot.deleteLater()
+        self.pie.plot(self._expenses)
+        self.trend = TrendCanvas(self, width=4, height=2.5)
+        self.charts.addWidget(self.trend, 1)
+        self.trend.plot(self._trend)
+        self.chart_ready.emit()
+
+    def closeEvent(self, event):
+        events.unsubscribe(self._emit_change)
+        self.runner.shutdown()
+        super().closeEvent(event)
+
     def refresh(self):
-        bal = get_balance()
-        self.balance_label.setText(f'Баланс: {bal:.2f}')
-        txs = get_transactions()
-        self.table.setRowCount(0)
-        for r in txs:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setItem(row, 0, QTableWidgetItem(str(r['id'])))
-            self.table.setItem(row, 1, QTableWidgetItem(r['date']))
-            self.table.setItem(row, 2, QTableWidgetItem(str(r['amount'])))
-            self.table.setItem(row, 3, QTableWidgetItem(r['type']))
-            # self.table.setItem(row, 4, QTableWidgetItem(r.get('category_name') or ''))
-            category_item = QTableWidgetItem()
-            name = r.get('category_name') or ''
-            icon_path = r.get('category_icon')
-            if icon_path:
-                from PyQt5.QtGui import QIcon
-                category_item.setIcon(QIcon(icon_path))
-            category_item.setText(name)
-            self.table.setItem(row, 4, category_item)
-            self.table.setItem(row, 5, QTableWidgetItem(r.get('note') or ''))
-
-        pie = get_expenses_by_category()
-        self.pie.plot(pie)
+        # повторные запросы схлопываются: результат устаревшего отбрасывается
+        self.runner.submit(
+            load_snapshot, self.model.page_size, key='refresh',
+            on_done=self._apply_snapshot, on_error=self._show_error
+        )
+
+    def _apply_snapshot(self, snap):
+        self._balance = snap['balance']
+        self._show_balance()
+        if not self._custom_view:
+            self.model.set_rows(snap['page'])
+        self._expenses = snap['expenses']
+        if self.pie is not None:
+            self.pie.plot(self._expenses)
+        self._apply_trend(snap['trend'])
+        self._apply_budgets(snap['budgets'])
+
+    def _apply_trend(self, report):
+        self._trend = report
+        if self.trend is not None:
+            self.trend.plot(report)
+
+    def update_view(self):
+        # поиск и фильтры: первая страница грузится в фоне, следующие — при прокрутке
+        query = self.search.text().strip()
+        flt = self.current_filter()
+        self._custom_view = bool(query) or not flt.is_default()
+        if not self._custom_view:
+            self.model.source = None
+            self.model.reload()
+            return
+
+        def fetch(last, offset, limit):
+            after = flt.cursor(last) if last else None
+            if query:
+                return search_transactions(query, flt, limit, after=after)
+            return query_transactions(flt, after, limit)
+
+        self._view_fetch = fetch
+        self.runner.submit(
+            fetch, None, 0, self.model.page_size, key='view',
+            on_done=lambda rows: self._apply_view(fetch, rows), on_error=self._show_error
+        )
+
+    def _apply_view(self, fetch, rows):
+        if fetch is not self._view_fetch or not self._custom_view:
+            return
+        self.model.source = fetch
+        self.model.set_rows(rows)
+
+    def check_budgets(self):
+        # счётчики потраченного ведёт база, проверка — одно чтение на бюджет
+        self.runner.submit(get_budgets, key='budgets', on_done=self._apply_budgets, on_error=self._show_error)
+
+    def _apply_budgets(self, budgets):
+        alerts = [b for b in budgets if b['status'] != 'ok']
+        over = sum(b['status'] == 'over' for b in alerts)
+        if alerts:
+            parts = []
+            if over:
+                parts.append(f'превышено: {over}')
+            if len(alerts) > over:
+                parts.append(f'близко к лимиту: {len(alerts) - over}')
+            self.budget_label.setText('Бюджеты — ' + ', '.join(parts))
+            self.budget_label.setToolTip('\n'.join(self._budget_text(b) for b in alerts))
+        self.budget_label.setVisible(bool(alerts))
+        # сообщение — только когда бюджет перешёл в более тревожное состояние
+        if self._budget_status is not None:
+            rank = {'ok': 0, 'warning': 1, 'over': 2}
+            worse = [b for b in alerts if rank[b['status']] > rank[self._budget_status.get(b['id'], 'ok')]]
+            if worse:
+                self.statusBar().showMessage('; '.join(self._budget_text(b) for b in worse), 10000)
+        self._budget_status = {b['id']: b['status'] for b in budgets}
+
+    def _budget_text(self, b):
+        state = 'превышен' if b['status'] == 'over' else 'близко к лимиту'
+        return (f"{b['category_name']} ({BUDGET_PERIOD_NAMES[b['period']]}): {state}, "
+                f"потрачено {b['spent']:.2f} из {b['amount']:.2f}")
+
+    def _show_error(self, error):
+        QMessageBox.critical(self, 'Ошибка', str(error))
+
+    def _run_write(self, fn, *args, on_done=None):
+        # запись — в фоновом потоке без key (записи не отменяют друг друга): пока импорт
+        # или архивация держат блокировку записи, ожидание идёт там, а не в GUI
+        self.runner.submit(fn, *args, on_done=on_done, on_error=self._show_write_error)
+
+    def _show_write_error(self, error):
+        if isinstance(error, ValueError):
+            # например, операции архивных лет только для чтения
+            QMessageBox.warning(self, 'Ошибка', str(error))
+        else:
+            self._show_error(error)
+
+    def _writer_busy(self):
+        # диалоги, которые пишут сами, не открываются, пока идёт долгая запись
+        if self.runner.is_running('import') or self.runner.is_running('archive'):
+            QMessageBox.information(self, 'Подождите', 'Идёт импорт или архивация, попробуйте после их завершения.')
+            return True
+        return False
+
+    def _show_balance(self):
+        self.balance_label.setText(f'Баланс: {self._balance:.2f}')
+
+    def on_db_change(self, event):
+        if event.reset or self.runner.is_running('refresh'):
+            # снимок в процессе загрузки может не включать это изменение
+            self.refresh()
+            self._fill_category_filter()
+            if self._custom_view:
+                self._view_timer.start()
+            return
+        if self._custom_view:
+            # изменённая строка может как попасть в выборку, так и выпасть из неё
+            self._view_timer.start()
+        else:
+            self.model.apply_change(event)
+        if event.balance_delta:
+            self._balance += event.balance_delta
+            self._show_balance()
+        if event.expense_deltas:
+            if self.pie is None:
+                self.refresh()
+            else:
+                self.pie.apply_deltas(event.expense_deltas)
+            self.check_budgets()
+        if event.inserted or event.updated or event.deleted:
+            # отчёт строится по сводным таблицам и не зависит от размера базы
+            self.runner.submit(load_trend, key='trend', on_done=self._apply_trend, on_error=self._show_error)
 
     def add_transaction(self):
         dlg = TransactionDialog(self)
         if dlg.exec_() == QDialog.Accepted:
             data = dlg.get_data()
-            add_transaction(data['date'], data['amount'], data['type'], data['category_id'], data['note'])
-            self.refresh()
+            self._run_write(add_transaction, data['date'], data['amount'], data['type'], data['category_id'], data['note'])
 
-    def edit_transaction(self, row, col):
-        tid = int(self.table.item(row,0).text())
+    def edit_transaction(self, index):
+        tid = self.model.transaction_id(index.row())
         # получаем полную информацию о транзакции
-        txs = get_transactions()
-        tx = next((t for t in txs if t['id']==tid), None)
+        tx = get_transaction(tid)
         if not tx:
             return
         from .db import update_transaction
         dlg = TransactionDialog(self, transaction=tx)
         if dlg.exec_() == QDialog.Accepted:
             d = dlg.get_data()
-            update_transaction(tid, d['date'], d['amount'], d['type'], d['category_id'], d['note'])
-            self.refresh()
+            self._run_write(update_transaction, tid, d['date'], d['amount'], d['type'], d['category_id'], d['note'])
 
     def on_table_context(self, pos):
         from PyQt5.QtWidgets import QMenu
         menu = QMenu()
-        sel = self.table.itemAt(pos)
-        if not sel:
+        index = self.table.indexAt(pos)
+        if not index.isValid():
             return
-        row = sel.row()
-        tid = int(self.table.item(row,0).text())
-        del_action = menu.addAction('Удалить')
+        tid = self.model.transaction_id(index.row())
+        ids = self.selected_ids()
+        if tid not in ids:
+            # щелчок вне выделения — действие над одной строкой
+            ids = [tid]
+        del_action = menu.addAction('Удалить' if len(ids) == 1 else f'Удалить выбранные ({len(ids)})')
+        cat_action = menu.addAction('Сменить категорию…')
+        type_action = menu.addAction('Сменить тип…')
+        note_action = menu.addAction('Заменить в заметках…')
+        menu.addSeparator()
+        last = last_bulk_action()
+        undo_action = menu.addAction(f"Отменить: {last['description']}" if last else 'Отменить массовое действие')
+        undo_action.setEnabled(last is not None)
         act = menu.exec_(self.table.viewport().mapToGlobal(pos))
         if act == del_action:
-            self.confirm_delete(tid)
+            if len(ids) == 1:
+                self.confirm_delete(tid)
+            else:
+                self.confirm_bulk_delete(ids)
+        elif act == cat_action:
+            self.recategorize(ids)
+        elif act == type_action:
+            self.change_type(ids)
+        elif act == note_action:
+            self.replace_notes(ids)
+        elif act == undo_action:
+            self.undo_bulk_action()
+
+    def selected_ids(self):
+        rows = sorted(i.row() for i in self.table.selectionModel().selectedRows())
+        return self.model.transaction_ids(rows)
+
+    def _run_bulk(self, fn, *args):
+        # массовое действие — одна транзакция в фоновом потоке; таблица, баланс и диаграммы
+        # обновляются одним событием изменений
+        self._run_write(fn, *args, on_done=self._bulk_done)
+
+    def _bulk_done(self, result):
+        if result is None:
+            self.statusBar().showMessage('Нечего отменять', 5000)
+        elif 'description' in result:
+            self.statusBar().showMessage(f"Отменено: {result['description']}", 5000)
+        else:
+            text = f"Изменено операций: {result['count']}"
+            if result['skipped']:
+                text += f", без изменений или в архиве: {result['skipped']}"
+            self.statusBar().showMessage(text, 5000)
+
+    def delete_selected(self):
+        ids = self.selected_ids()
+        if len(ids) == 1:
+            self.confirm_delete(ids[0])
+        elif ids:
+            self.confirm_bulk_delete(ids)
+
+    def confirm_bulk_delete(self, ids):
+        ok = QMessageBox.question(
+            self, 'Подтвердите', f'Удалить выбранные операции ({len(ids)})?', QMessageBox.Yes | QMessageBox.No
+        )
+        if ok == QMessageBox.Yes:
+            self._run_bulk(delete_transactions, ids)
+
+    def recategorize(self, ids):
+        from PyQt5.QtWidgets import QInputDialog
+        cats = get_categories()
+        names = ['— без категории —'] + [c['name'] for c in cats]
+        name, ok = QInputDialog.getItem(self, 'Категория', f'Новая категория для операций: {len(ids)}', names, 0, False)
+        if ok:
+            cid = None if names.index(name) == 0 else cats[names.index(name) - 1]['id']
+            self._run_bulk(set_transactions_category, ids, cid)
+
+    def change_type(self, ids):
+        from PyQt5.QtWidgets import QInputDialog
+        ttype, ok = QInputDialog.getItem(self, 'Тип', f'Новый тип для операций: {len(ids)}', ['Трата', 'Доход'], 0, False)
+        if ok:
+            self._run_bulk(set_transactions_type, ids, ttype)
+
+    def replace_notes(self, ids):
+        dlg = NoteReplaceDialog(self, count=len(ids))
+        if dlg.exec_() == QDialog.Accepted:
+            find, replace = dlg.get_data()
+            self._run_bulk(replace_in_notes, ids, find, replace)
+
+    def undo_bulk_action(self):
+        self._run_bulk(undo_bulk)
 
     def confirm_delete(self, tid):
         ok = QMessageBox.question(self, 'Подтвердите', 'Удалить транзакцию?', QMessageBox.Yes | QMessageBox.No)
         if ok == QMessageBox.Yes:
-            delete_transaction(tid)
-            self.refresh()
+            self._run_write(delete_transaction, tid)
 
     def add_category(self):
+        if self._writer_busy():
+            return
         dlg = CategoryDialog(self)
         if dlg.exec_() == QDialog.Accepted:
-            self.refresh()
+            # новая категория не меняет операций и не присылает событие — фильтр обновляем сами
+            self._fill_category_filter()
+
+    def show_query_stats(self):
+        QueryStatsDialog(self).exec_()
 
     def import_csv(self):
-        path, _ = QFileDialog.getOpenFileName(self, 'Импорт CSV', '', 'CSV files (*.csv)')
-        if path:
-            import_csv(path)
-            self.refresh()
+        # можно выбрать сразу несколько выписок; строки с ошибками не прерывают импорт
+        paths, _ = QFileDialog.getOpenFileNames(self, 'Импорт CSV', '', 'CSV files (*.csv *.csv.gz)')
+        if paths:
+            box = QMessageBox(self)
+            box.setWindowTitle('Импорт')
+            box.setText('Добавить только новые операции или заменить все операции содержимым файлов?')
+            merge_btn = box.addButton('Добавить новые', QMessageBox.AcceptRole)
+            replace_btn = box.addButton('Заменить все', QMessageBox.DestructiveRole)
+            box.addButton(QMessageBox.Cancel)
+            box.setDefaultButton(merge_btn)
+            box.exec_()
+            if box.clickedButton() not in (merge_btn, replace_btn):
+                return
+            mode = 'merge' if box.clickedButton() is merge_btn else 'replace'
+
+            progress = QProgressDialog('Импорт CSV...', 'Отмена', 0, 0, self)
+            progress.setWindowTitle('Импорт')
+            progress.setWindowModality(Qt.WindowModal)
+            progress.setMinimumDuration(0)
+
+            def on_progress(done):
+                progress.setLabelText(f'Импортировано строк: {done}')
+
+            task = self.runner.submit(
+                import_files, paths, mode=mode, key='import',
+                on_done=self._import_done, on_progress=on_progress, on_error=self._show_error
+            )
+            progress.canceled.connect(task.cancel)
+            task.signals.ended.connect(progress.close)
+            progress.show()
+
+    def _import_done(self, result):
+        self.statusBar().showMessage(
+            f"Импортировано строк: {result['imported']}, уже были в базе: {result['skipped']}, "
+            f"файлов: {result['files']}, загруженных ранее файлов: {result['skipped_files']}", 5000)
+        if result['rejected']:
+            lines = [f'{os.path.basename(src)}:{line}: {err}' for src, line, err, _ in result['rejects'][:20]]
+            QMessageBox.warning(
+                self, 'Импорт',
+                f"Пропущено строк с ошибками: {result['rejected']}\n\n" + '\n'.join(lines)
+            )
 
     def export_csv(self):
-        path, _ = QFileDialog.getSaveFileName(self, 'Экспорт CSV', '', 'CSV files (*.csv)')
+        path, _ = QFileDialog.getSaveFileName(self, 'Экспорт CSV', '', 'CSV files (*.csv);;Сжатый CSV (*.csv.gz)')
         if path:
-            export_csv(path)
+            self.runner.submit(
+                export_csv, path, key='export',
+                on_done=lambda _: self.statusBar().showMessage(f'Экспорт завершён: {path}', 5000),
+                on_error=self._show_error
+            )
+
+    def budgets_dialog(self):
+        if self._writer_busy():
+            return
+        BudgetDialog(self).exec_()
+        self.check_budgets()
+
+    def archive_dialog(self):
+        # закрытый год переносится в отдельный файл только для чтения; баланс, отчёты,
+        # поиск и экспорт по-прежнему видят всю историю
+        from PyQt5.QtWidgets import QInputDialog
+        years = archivable_years()
+        archived = ', '.join(str(a['year']) for a in get_archives()) or 'нет'
+        if not years:
+            QMessageBox.information(self, 'Архив', f'Нет закрытых лет для переноса.\nВ архиве: {archived}')
+            return
+        year, ok = QInputDialog.getItem(
+            self, 'Архив',
+            f'В архиве: {archived}\n\nПеренести в архив год (операции станут только для чтения):',
+            [str(y) for y in years], 0, False
+        )
+        if not ok:
+            return
+        self.runner.submit(
+            archive_and_vacuum, int(year), key='archive',
+            on_done=lambda r: self.statusBar().showMessage(
+                f"В архив перенесено операций за {r['year']} год: {r['tx_count']}", 5000),
+            on_error=self._show_error
+        )
 
     def clear_database_dialog(self):
         reply = QMessageBox.question(
@@ -201,19 +657,42 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, 'Отмена', 'Неправильное подтверждение. Операция отменена.')
             return
 
-        try:
-            clear_database()
-        except Exception as e:
-            QMessageBox.critical(self, 'Ошибка', f'При очистке базы произошла ошибка:\n{e}')
-            return
+        self.runner.submit(
+            clear_and_init,
+            on_done=lambda _: QMessageBox.information(self, 'Готово', 'База данных успешно очищена.'),
+            on_error=lambda e: QMessageBox.critical(self, 'Ошибка', f'При очистке базы произошла ошибка:\n{e}')
+        )
 
-        init_db()  # пересоздаст таблицы, если они были удалены или были пустыми
-        QMessageBox.information(self, 'Готово', 'База данных успешно очищена.')
-        self.refresh()
+
+def print_startup_profile():
+    prev = _STARTUP[0][1]
+    print('Профиль запуска:', file=sys.stderr)
+    for label, t in _STARTUP[1:]:
+        print(f'  {label:<24} {(t - prev) * 1000:8.1f} мс', file=sys.stderr)
+        prev = t
+    total = _STARTUP[-1][1] - _STARTUP[0][1]
+    print(f'  {"итого":<24} {total * 1000:8.1f} мс', file=sys.stderr)
 
 
 if __name__ == '__main__':
+    # нужно для пула процессов импорта в собранном приложении
+    multiprocessing.freeze_support()
+    profile = '--profile-startup' in sys.argv
+    if profile:
+        sys.argv.remove('--profile-startup')
     app = QApplication(sys.argv)
+    app.aboutToQuit.connect(close_pool)
+    _mark('QApplication')
     win = MainWindow()
+    _mark('MainWindow')
+    if profile:
+        # таймер срабатывает раньше отложенной загрузки диаграммы
+        QTimer.singleShot(0, lambda: _mark('первый показ окна'))
+
+        def on_chart_ready():
+            _mark('диаграмма (matplotlib)')
+            print_startup_profile()
+
+        win.chart_ready.connect(on_chart_ready)
     win.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,522 @@
+import hashlib
+
+# SQL внутри миграций зафиксирован на момент их написания и не должен
+# ссылаться на текущие определения схемы в app.db
+
+
+def _amounts_to_minor_units(conn):
+    # REAL -> INTEGER (копейки/центы) + валюта; sqlite не умеет менять тип
+    # столбца, поэтому таблица пересоздаётся вместе с индексами и триггерами
+    conn.execute(
+        """
+        CREATE TABLE transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            amount INTEGER NOT NULL, -- в минимальных единицах валюты
+            currency TEXT NOT NULL DEFAULT 'RUB',
+            type TEXT NOT NULL,
+            category_id INTEGER,
+            note TEXT,
+            FOREIGN KEY(category_id) REFERENCES categories(id)
+        )
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO transactions_new (id, date, amount, currency, type, category_id, note)
+        SELECT id, date, CAST(ROUND(amount * 100) AS INTEGER), 'RUB', type, category_id, note
+        FROM transactions
+        """
+    )
+    conn.execute("DROP TABLE transactions")
+    conn.execute("ALTER TABLE transactions_new RENAME TO transactions")
+    for sql in MIGRATIONS[0]:
+        conn.execute(sql)
+
+    conn.execute("DROP TABLE IF EXISTS balance_summary")
+    conn.execute("DROP TABLE IF EXISTS category_totals")
+    conn.execute(
+        """
+        CREATE TABLE balance_summary (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            balance INTEGER NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0,
+            deferred INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE category_totals (
+            category_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            month TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (category_id, type, month)
+        ) WITHOUT ROWID
+        """
+    )
+    for sql in _AGGREGATE_TRIGGERS_V3:
+        conn.execute(sql)
+    conn.execute(
+        """
+        INSERT INTO balance_summary (id, balance, tx_count, version)
+        SELECT 1, IFNULL(SUM(CASE type WHEN 'Доход' THEN amount WHEN 'Трата' THEN -amount ELSE 0 END), 0), COUNT(*), 1
+        FROM transactions
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO category_totals (category_id, type, month, total, tx_count)
+        SELECT IFNULL(category_id, 0), type, substr(date, 1, 7), SUM(amount), COUNT(*)
+        FROM transactions GROUP BY 1, 2, 3
+        """
+    )
+    conn.execute("ANALYZE transactions")
+
+
+_AGG_GUARD = "WHEN (SELECT deferred FROM balance_summary WHERE id = 1) = 0"
+_AGG_ADD_NEW = """
+        INSERT INTO category_totals (category_id, type, month, total, tx_count)
+        VALUES (IFNULL(NEW.category_id, 0), NEW.type, substr(NEW.date, 1, 7), NEW.amount, 1)
+        ON CONFLICT (category_id, type, month) DO UPDATE SET
+            total = total + excluded.total,
+            tx_count = tx_count + 1;"""
+_AGG_SUB_OLD = """
+        UPDATE category_totals SET total = total - OLD.amount, tx_count = tx_count - 1
+        WHERE category_id = IFNULL(OLD.category_id, 0) AND type = OLD.type AND month = substr(OLD.date, 1, 7);
+        DELETE FROM category_totals
+        WHERE category_id = IFNULL(OLD.category_id, 0) AND type = OLD.type AND month = substr(OLD.date, 1, 7)
+          AND tx_count <= 0;"""
+_SIGNED_NEW = "(CASE NEW.type WHEN 'Доход' THEN NEW.amount WHEN 'Трата' THEN -NEW.amount ELSE 0 END)"
+_SIGNED_OLD = "(CASE OLD.type WHEN 'Доход' THEN OLD.amount WHEN 'Трата' THEN -OLD.amount ELSE 0 END)"
+
+_AGGREGATE_TRIGGERS_V3 = [
+    f"""
+    CREATE TRIGGER trg_transactions_ai AFTER INSERT ON transactions {_AGG_GUARD}
+    BEGIN
+        UPDATE balance_summary SET balance = balance + {_SIGNED_NEW},
+            tx_count = tx_count + 1, version = version + 1 WHERE id = 1;{_AGG_ADD_NEW}
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_transactions_ad AFTER DELETE ON transactions {_AGG_GUARD}
+    BEGIN
+        UPDATE balance_summary SET balance = balance - {_SIGNED_OLD},
+            tx_count = tx_count - 1, version = version + 1 WHERE id = 1;{_AGG_SUB_OLD}
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_transactions_au AFTER UPDATE OF date, amount, type, category_id ON transactions {_AGG_GUARD}
+    BEGIN
+        UPDATE balance_summary SET balance = balance - {_SIGNED_OLD} + {_SIGNED_NEW},
+            version = version + 1 WHERE id = 1;{_AGG_SUB_OLD}{_AGG_ADD_NEW}
+    END
+    """,
+]
+
+
+_DAILY_ADD_NEW = """
+        INSERT INTO daily_totals (day, category_id, type, total, tx_count)
+        VALUES (NEW.date, IFNULL(NEW.category_id, 0), NEW.type, NEW.amount, 1)
+        ON CONFLICT (day, category_id, type) DO UPDATE SET
+            total = total + excluded.total,
+            tx_count = tx_count + 1;"""
+_DAILY_SUB_OLD = """
+        UPDATE daily_totals SET total = total - OLD.amount, tx_count = tx_count - 1
+        WHERE day = OLD.date AND category_id = IFNULL(OLD.category_id, 0) AND type = OLD.type;
+        DELETE FROM daily_totals
+        WHERE day = OLD.date AND category_id = IFNULL(OLD.category_id, 0) AND type = OLD.type
+          AND tx_count <= 0;"""
+
+_AGGREGATE_TRIGGERS_V4 = [
+    f"""
+    CREATE TRIGGER trg_transactions_ai AFTER INSERT ON transactions {_AGG_GUARD}
+    BEGIN
+        UPDATE balance_summary SET balance = balance + {_SIGNED_NEW},
+            tx_count = tx_count + 1, version = version + 1 WHERE id = 1;{_AGG_ADD_NEW}{_DAILY_ADD_NEW}
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_transactions_ad AFTER DELETE ON transactions {_AGG_GUARD}
+    BEGIN
+        UPDATE balance_summary SET balance = balance - {_SIGNED_OLD},
+            tx_count = tx_count - 1, version = version + 1 WHERE id = 1;{_AGG_SUB_OLD}{_DAILY_SUB_OLD}
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_transactions_au AFTER UPDATE OF date, amount, type, category_id ON transactions {_AGG_GUARD}
+    BEGIN
+        UPDATE balance_summary SET balance = balance - {_SIGNED_OLD} + {_SIGNED_NEW},
+            version = version + 1 WHERE id = 1;{_AGG_SUB_OLD}{_AGG_ADD_NEW}{_DAILY_SUB_OLD}{_DAILY_ADD_NEW}
+    END
+    """,
+]
+
+
+def _daily_totals(conn):
+    # суммы по дням для отчётов за произвольные периоды
+    conn.execute(
+        """
+        CREATE TABLE daily_totals (
+            day TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category_id, type)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO daily_totals (day, category_id, type, total, tx_count)
+        SELECT date, IFNULL(category_id, 0), type, SUM(amount), COUNT(*)
+        FROM transactions GROUP BY 1, 2, 3
+        """
+    )
+    for name in ('trg_transactions_ai', 'trg_transactions_ad', 'trg_transactions_au'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for sql in _AGGREGATE_TRIGGERS_V4:
+        conn.execute(sql)
+
+
+_FTS_ROW_NEW = "IFNULL(NEW.note, ''), IFNULL((SELECT name FROM categories WHERE id = NEW.category_id), '')"
+
+_FTS_TRIGGERS_V5 = [
+    f"""
+    CREATE TRIGGER trg_transactions_fts_ai AFTER INSERT ON transactions {_AGG_GUARD}
+    BEGIN
+        INSERT INTO transactions_fts (rowid, note, category) VALUES (NEW.id, {_FTS_ROW_NEW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_transactions_fts_ad AFTER DELETE ON transactions {_AGG_GUARD}
+    BEGIN
+        DELETE FROM transactions_fts WHERE rowid = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_transactions_fts_au AFTER UPDATE OF note, category_id ON transactions {_AGG_GUARD}
+    BEGIN
+        DELETE FROM transactions_fts WHERE rowid = OLD.id;
+        INSERT INTO transactions_fts (rowid, note, category) VALUES (NEW.id, {_FTS_ROW_NEW});
+    END
+    """,
+    """
+    CREATE TRIGGER trg_categories_fts_au AFTER UPDATE OF name ON categories
+    BEGIN
+        UPDATE transactions_fts SET category = NEW.name
+        WHERE rowid IN (SELECT id FROM transactions WHERE category_id = NEW.id);
+    END
+    """,
+]
+
+
+def _transactions_fts(conn):
+    # полнотекстовый индекс по заметкам и названиям категорий; rowid = transactions.id
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE transactions_fts USING fts5(
+            note, category,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO transactions_fts (rowid, note, category)
+        SELECT t.id, IFNULL(t.note, ''), IFNULL(c.name, '')
+        FROM transactions t LEFT JOIN categories c ON c.id = t.category_id
+        """
+    )
+    for sql in _FTS_TRIGGERS_V5:
+        conn.execute(sql)
+
+
+def _row_digest_v7(date, amount, ttype, category, note):
+    key = '\x1f'.join((date, str(amount), ttype, category or '', note or ''))
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def _occurrence_hash_v7(digest, k):
+    if k == 0:
+        return digest
+    data = digest.to_bytes(8, 'big', signed=True) + k.to_bytes(4, 'big')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+
+def _row_hashes(conn):
+    # отпечаток содержимого строки для повторных импортов и журнал импортов;
+    # одинаковые строки различаются порядковым номером
+    conn.execute("ALTER TABLE transactions ADD COLUMN row_hash INTEGER")
+    seen = {}
+    updates = []
+    cur = conn.execute(
+        """
+        SELECT t.id, t.date, t.amount, t.type, c.name, t.note
+        FROM transactions t LEFT JOIN categories c ON c.id = t.category_id
+        ORDER BY t.id
+        """
+    )
+    for tid, date, amount, ttype, category, note in cur:
+        digest = _row_digest_v7(date, amount, ttype, category, note)
+        k = seen.get(digest, 0)
+        seen[digest] = k + 1
+        updates.append((_occurrence_hash_v7(digest, k), tid))
+    conn.executemany("UPDATE transactions SET row_hash = ? WHERE id = ?", updates)
+    conn.execute("CREATE UNIQUE INDEX idx_transactions_row_hash ON transactions (row_hash)")
+    conn.execute(
+        """
+        CREATE TABLE import_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TEXT NOT NULL,
+            finished_at TEXT,
+            mode TEXT NOT NULL,
+            files INTEGER NOT NULL DEFAULT 0,
+            imported INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE imported_files (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            rows INTEGER NOT NULL DEFAULT 0,
+            session_id INTEGER REFERENCES import_sessions(id)
+        )
+        """
+    )
+
+
+def _budget_period_v10(day):
+    # начало периода бюджета b, в который попадает дата day: неделя — с понедельника
+    return (f"CASE b.period WHEN 'week' THEN date({day}, '-6 days', 'weekday 1')"
+            f" WHEN 'year' THEN substr({day}, 1, 4) || '-01-01'"
+            f" ELSE substr({day}, 1, 7) || '-01' END")
+
+
+_BUDGET_ADD_NEW = f"""
+        INSERT INTO budget_spent (budget_id, period_start, spent)
+        SELECT b.id, {_budget_period_v10('NEW.date')}, NEW.amount FROM budgets b
+        WHERE NEW.type = 'Трата' AND b.category_id = NEW.category_id
+        ON CONFLICT (budget_id, period_start) DO UPDATE SET spent = spent + excluded.spent;"""
+# вычитание — тем же upsert с обратным знаком: поиск по первичному ключу, а не просмотр счётчиков
+_BUDGET_SUB_OLD = f"""
+        INSERT INTO budget_spent (budget_id, period_start, spent)
+        SELECT b.id, {_budget_period_v10('OLD.date')}, -OLD.amount FROM budgets b
+        WHERE OLD.type = 'Трата' AND b.category_id = OLD.category_id
+        ON CONFLICT (budget_id, period_start) DO UPDATE SET spent = spent + excluded.spent;"""
+
+_BUDGET_TRIGGERS_V10 = [
+    f"""
+    CREATE TRIGGER trg_transactions_budget_ai AFTER INSERT ON transactions
+    {_AGG_GUARD} AND NEW.category_id IS NOT NULL
+    BEGIN{_BUDGET_ADD_NEW}
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_transactions_budget_ad AFTER DELETE ON transactions
+    {_AGG_GUARD} AND OLD.category_id IS NOT NULL
+    BEGIN{_BUDGET_SUB_OLD}
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_transactions_budget_au AFTER UPDATE OF date, amount, type, category_id ON transactions
+    {_AGG_GUARD} AND (OLD.category_id IS NOT NULL OR NEW.category_id IS NOT NULL)
+    BEGIN{_BUDGET_SUB_OLD}{_BUDGET_ADD_NEW}
+    END
+    """,
+]
+
+
+def _budgets(conn):
+    # лимиты трат по категориям и счётчики потраченного за каждый период бюджета;
+    # счётчики ведут триггеры, как и остальные сводные таблицы
+    conn.execute(
+        """
+        CREATE TABLE budgets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_id INTEGER NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+            period TEXT NOT NULL CHECK (period IN ('week', 'month', 'year')),
+            amount INTEGER NOT NULL, -- лимит в минимальных единицах
+            threshold REAL NOT NULL DEFAULT 0.8, -- доля лимита, с которой показывается предупреждение
+            UNIQUE (category_id, period)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE budget_spent (
+            budget_id INTEGER NOT NULL REFERENCES budgets(id) ON DELETE CASCADE,
+            period_start TEXT NOT NULL, -- YYYY-MM-DD
+            spent INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (budget_id, period_start)
+        ) WITHOUT ROWID
+        """
+    )
+    for sql in _BUDGET_TRIGGERS_V10:
+        conn.execute(sql)
+
+
+def _fill_row_hashes(conn):
+    # строки, добавленные вручную до появления row_hash у add_transaction; номер повтора —
+    # первый свободный, как у новых строк
+    taken = {r[0] for r in conn.execute("SELECT row_hash FROM transactions WHERE row_hash IS NOT NULL")}
+    updates = []
+    cur = conn.execute(
+        """
+        SELECT t.id, t.date, t.amount, t.type, c.name, t.note
+        FROM transactions t LEFT JOIN categories c ON c.id = t.category_id
+        WHERE t.row_hash IS NULL
+        ORDER BY t.id
+        """
+    )
+    for tid, date, amount, ttype, category, note in cur:
+        digest = _row_digest_v7(date, amount, ttype, category, note)
+        k = 0
+        while _occurrence_hash_v7(digest, k) in taken:
+            k += 1
+        h = _occurrence_hash_v7(digest, k)
+        taken.add(h)
+        updates.append((h, tid))
+    conn.executemany("UPDATE transactions SET row_hash = ? WHERE id = ?", updates)
+
+
+_CATEGORIES_FTS_TRIGGERS_V12 = [
+    """
+    CREATE TRIGGER trg_categories_names_fts_ai AFTER INSERT ON categories
+    BEGIN
+        INSERT INTO categories_fts (rowid, name) VALUES (NEW.id, NEW.name);
+    END
+    """,
+    """
+    CREATE TRIGGER trg_categories_names_fts_ad AFTER DELETE ON categories
+    BEGIN
+        INSERT INTO categories_fts (categories_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+    END
+    """,
+    """
+    CREATE TRIGGER trg_categories_names_fts_au AFTER UPDATE OF name ON categories
+    BEGIN
+        INSERT INTO categories_fts (categories_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+        INSERT INTO categories_fts (rowid, name) VALUES (NEW.id, NEW.name);
+    END
+    """,
+]
+
+
+def _categories_fts(conn):
+    # индекс названий категорий: архивы только для чтения, и категории их строк
+    # ищутся по текущим названиям основной базы
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE categories_fts USING fts5(
+            name,
+            content = 'categories', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """
+    )
+    conn.execute("INSERT INTO categories_fts (categories_fts) VALUES ('rebuild')")
+    for sql in _CATEGORIES_FTS_TRIGGERS_V12:
+        conn.execute(sql)
+
+
+# версия схемы хранится в PRAGMA user_version;
+# миграция с номером N — элемент MIGRATIONS[N - 1], порядок менять нельзя
+MIGRATIONS = [
+    # 1: индексы для сортировки по дате, выборок по категории и по типу
+    [
+        "CREATE INDEX IF NOT EXISTS idx_transactions_date_id ON transactions (date DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions (category_id, type, amount)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_type_date ON transactions (type, date)",
+    ],
+    # 2: статистика для планировщика
+    [
+        "ANALYZE",
+    ],
+    # 3: суммы в целых минимальных единицах и валюта операции
+    _amounts_to_minor_units,
+    # 4: дневные суммы по категориям
+    _daily_totals,
+    # 5: полнотекстовый поиск (FTS5)
+    _transactions_fts,
+    # 6: индексы для фильтров: сортировка по сумме и лента одной категории по дате
+    [
+        "CREATE INDEX IF NOT EXISTS idx_transactions_amount_id ON transactions (amount DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions (category_id, date DESC, id DESC)",
+        "ANALYZE transactions",
+    ],
+    # 7: отпечатки строк и журнал импортов
+    _row_hashes,
+    # 8: реестр годовых архивов — закрытые годы в отдельных файлах только для чтения
+    [
+        """
+        CREATE TABLE archives (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL, -- относительно папки основной базы
+            tx_count INTEGER NOT NULL DEFAULT 0,
+            balance INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+        """,
+    ],
+    # 9: журнал массовых изменений для отмены — прежние версии затронутых строк
+    [
+        """
+        CREATE TABLE bulk_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            action TEXT NOT NULL,
+            description TEXT,
+            tx_count INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE bulk_journal_rows (
+            journal_id INTEGER NOT NULL REFERENCES bulk_journal(id) ON DELETE CASCADE,
+            id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            type TEXT NOT NULL,
+            category_id INTEGER,
+            note TEXT,
+            row_hash INTEGER,
+            PRIMARY KEY (journal_id, id)
+        ) WITHOUT ROWID
+        """,
+    ],
+    # 10: бюджеты по категориям и счётчики потраченного
+    _budgets,
+    # 11: row_hash у строк, введённых вручную
+    _fill_row_hashes,
+    # 12: поиск по названиям категорий для строк архивов
+    _categories_fts,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    # применяет недостающие миграции; вызывается внутри транзакции init_db
+    current = schema_version(conn)
+    for version in range(current + 1, len(MIGRATIONS) + 1):
+        step = MIGRATIONS[version - 1]
+        if callable(step):
+            step(conn)
+        else:
+            for sql in step:
+                conn.execute(sql)
+        conn.execute(f"PRAGMA user_version = {version}")
+    return schema_version(conn)
@@ -0,0 +1,149 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from app.db import get_transactions_page
+from app.icons import get_icon
+
+HEADERS = ['ID', 'Дата', 'Сумма', 'Тип', 'Категория', 'Примечание']
+FIELDS = ['id', 'date', 'amount', 'type', 'category_name', 'note']
+
+
+class TransactionTableModel(QAbstractTableModel):
+    # строки подгружаются страницами по мере прокрутки (canFetchMore/fetchMore)
+    def __init__(self, parent=None, page_size=500):
+        super().__init__(parent)
+        self.page_size = page_size
+        self._rows = []
+        self._by_id = {}
+        self._has_more = True
+        # source(last, offset, limit) -> следующая страница после строки last;
+        # None — все операции по дате (при поиске и фильтрах подставляется своя выборка)
+        self.source = None
+
+    def _fetch(self, last):
+        if self.source is None:
+            after = (last['date'], last['id']) if last else None
+            return get_transactions_page(after=after, limit=self.page_size)
+        return self.source(last, len(self._rows), self.page_size)
+
+    def reload(self):
+        self._rows = []
+        self.set_rows(self._fetch(None))
+
+    def set_rows(self, rows):
+        # первая страница может быть загружена заранее в фоновом потоке
+        self.beginResetModel()
+        self._rows = list(rows)
+        self._by_id = {r['id']: r for r in self._rows}
+        self._has_more = len(self._rows) == self.page_size
+        self.endResetModel()
+
+    def _position(self, key):
+        # строки отсортированы по (date, id) по убыванию — бинарный поиск
+        lo, hi = 0, len(self._rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            r = self._rows[mid]
+            if (r['date'], r['id']) > key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _remove(self, ids):
+        # позиции удаляемых строк собираются в непрерывные диапазоны — один сигнал на диапазон,
+        # а не на строку (массовое удаление выделенных строк)
+        positions = []
+        for tid in ids:
+            r = self._by_id.pop(tid, None)
+            if r is not None:
+                positions.append(self._position((r['date'], r['id'])))
+        positions.sort(reverse=True)
+        i = 0
+        while i < len(positions):
+            first = last = positions[i]
+            i += 1
+            while i < len(positions) and positions[i] == first - 1:
+                first = positions[i]
+                i += 1
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._rows[first:last + 1]
+            self.endRemoveRows()
+
+    def _insert(self, row):
+        pos = self._position((row['date'], row['id']))
+        if pos == len(self._rows) and self._has_more:
+            # строка старше загруженного окна — придёт с очередной страницей
+            return
+        self.beginInsertRows(QModelIndex(), pos, pos)
+        self._rows.insert(pos, row)
+        self._by_id[row['id']] = row
+        self.endInsertRows()
+
+    def apply_change(self, event):
+        # точечное обновление вместо полной перезагрузки
+        self._remove(event.deleted)
+        changed, moved = [], []
+        for row in event.updated:
+            old = self._by_id.get(row['id'])
+            if old is not None and old['date'] == row['date']:
+                pos = self._position((old['date'], old['id']))
+                self._rows[pos] = self._by_id[row['id']] = row
+                changed.append(pos)
+            else:
+                moved.append(row)
+        if changed:
+            # один сигнал на все строки, изменённые на месте
+            self.dataChanged.emit(self.index(min(changed), 0), self.index(max(changed), len(HEADERS) - 1))
+        self._remove([row['id'] for row in moved])
+        for row in moved:
+            self._insert(row)
+        for row in event.inserted:
+            self._insert(row)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        r = self._rows[index.row()]
+        col = index.column()
+        if role == Qt.DisplayRole:
+            value = r.get(FIELDS[col])
+            return '' if value is None else str(value)
+        if role == Qt.DecorationRole and col == 4:
+            icon_path = r.get('category_icon')
+            if icon_path:
+                return get_icon(icon_path)
+        if role == Qt.UserRole:
+            return r['id']
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._has_more:
+            return
+        page = self._fetch(self._rows[-1] if self._rows else None)
+        self._has_more = len(page) == self.page_size
+        if not page:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        self._rows.extend(page)
+        self._by_id.update((r['id'], r) for r in page)
+        self.endInsertRows()
+
+    def transaction_id(self, row):
+        return self._rows[row]['id']
+
+    def transaction_ids(self, rows):
+        return [self._rows[r]['id'] for r in rows]
@@ -0,0 +1,129 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# настройки, применяемые к каждому новому соединению
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # ~16 МБ
+    "PRAGMA mmap_size=268435456",  # 256 МБ
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+]
+
+
+class PooledConnection(sqlite3.Connection):
+    # подкласс нужен, чтобы хранить на соединении служебные атрибуты
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.after_commit = []
+        self.trace = None
+        # подключённые архивы (год -> имя схемы) и номер их списка, см. app.db._prepare_conn
+        self.archives = {}
+        self.archive_epoch = None
+
+
+class ConnectionPool:
+    # общий для всех пулов обработчик трассировки SQL (см. app.instrument)
+    trace_callback = None
+
+    def __init__(self, path, max_idle=4, timeout=30.0, prepare=None):
+        self.path = str(path)
+        self.max_idle = max_idle
+        self.timeout = timeout
+        # prepare(conn) вызывается на внешнем уровне до BEGIN: ATTACH внутри транзакции невозможен
+        self.prepare = prepare
+        self._idle = []
+        self._all = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            isolation_level=None,  # транзакциями управляем сами
+            factory=PooledConnection,
+            uri=True,  # для ATTACH 'file:...?mode=ro'
+        )
+        conn.row_factory = sqlite3.Row
+        for p in PRAGMAS:
+            conn.execute(p)
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        conn = self._connect()
+        with self._lock:
+            self._all.add(conn)
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            if conn in self._all and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self._all.discard(conn)
+        conn.close()
+
+    @contextmanager
+    def connection(self, write=False):
+        # вложенные вызовы в одном потоке используют то же соединение
+        # и одну транзакцию; фиксация происходит на внешнем уровне.
+        # write=True — BEGIN IMMEDIATE: блокировка записи берётся сразу и ждёт busy timeout.
+        # В отложенной транзакции запись после чтения при чужой фиксации между ними
+        # сразу падает с «database is locked», поэтому писатели открывают её так
+        # (вложенный вызов наследует режим внешнего)
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is not None:
+            local.depth += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+
+        conn = self._acquire()
+        callback = ConnectionPool.trace_callback
+        if conn.trace is not callback:
+            conn.set_trace_callback(callback)
+            conn.trace = callback
+        local.conn = conn
+        local.depth = 1
+        try:
+            if self.prepare is not None:
+                self.prepare(conn)
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            yield conn
+        except BaseException:
+            conn.after_commit.clear()
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            if conn.in_transaction:
+                conn.commit()
+        finally:
+            local.conn = None
+            local.depth = 0
+            callbacks, conn.after_commit = conn.after_commit, []
+            self._release(conn)
+        # уведомления отправляются только после успешной фиксации
+        for cb in callbacks:
+            cb()
+
+    def close(self):
+        with self._lock:
+            conns = list(self._all)
+            self._all.clear()
+            self._idle.clear()
+        for c in conns:
+            try:
+                c.close()
+            except sqlite3.Error:
+                pass
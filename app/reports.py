@@ -0,0 +1,163 @@
+import calendar
+from collections import OrderedDict
+
+import numpy as np
+
+from app import db
+from app.db import get_conn, get_categories, get_data_version, MINOR_UNITS
+
+# отчёты по периодам; группировка идёт по сводным таблицам (дневным или
+# месячным суммам), поэтому стоимость не зависит от числа операций. Суммы в них —
+# целые минимальные единицы, итоги точные; NumPy раскладывает их по периодам и категориям
+
+PERIOD_KEYS = {
+    'day': "day",
+    'week': "date(day, '-' || ((CAST(strftime('%w', day) AS INTEGER) + 6) % 7) || ' days')",  # понедельник
+    'month': "substr(day, 1, 7)",
+    'year': "substr(day, 1, 4)",
+}
+MONTH_KEYS = {'month': "month", 'year': "substr(month, 1, 4)"}
+
+_report_cache = OrderedDict()
+REPORT_CACHE_SIZE = 32
+
+
+def _month_aligned(date_from, date_to):
+    if date_from and not date_from.endswith('-01'):
+        return False
+    if date_to:
+        y, m, d = (int(x) for x in date_to[:10].split('-'))
+        if d != calendar.monthrange(y, m)[1]:
+            return False
+    return True
+
+
+def _grouped_rows(conn, period, date_from, date_to):
+    # (период, категория, доход, расход) в минимальных единицах, по возрастанию периода
+    if period in MONTH_KEYS and _month_aligned(date_from, date_to):
+        key, table, col, lo, hi = MONTH_KEYS[period], 'category_totals', 'month', \
+            date_from and date_from[:7], date_to and date_to[:7]
+    else:
+        key, table, col, lo, hi = PERIOD_KEYS[period], 'daily_totals', 'day', date_from, date_to
+    clauses, params = [], []
+    if lo:
+        clauses.append(f"{col} >= ?")
+        params.append(lo)
+    if hi:
+        clauses.append(f"{col} <= ?")
+        params.append(hi)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    q = (f"SELECT {key} AS period, category_id,"
+         f" SUM(CASE WHEN type='Доход' THEN total ELSE 0 END),"
+         f" SUM(CASE WHEN type='Трата' THEN total ELSE 0 END)"
+         f" FROM {table}{where} GROUP BY 1, 2 ORDER BY 1, 2")
+    cur = conn.execute(q, params)
+    cur.row_factory = None
+    return cur.fetchall()
+
+
+def _opening_balance(conn, date_from):
+    if not date_from:
+        return 0
+    r = conn.execute(
+        "SELECT IFNULL(SUM(CASE type WHEN 'Доход' THEN total WHEN 'Трата' THEN -total ELSE 0 END), 0)"
+        " FROM daily_totals WHERE day < ?", (date_from,)
+    ).fetchone()
+    return r[0]
+
+
+def _period_key(period, day):
+    # ключ периода для даты YYYY-MM-DD в том же виде, что даёт PERIOD_KEYS
+    if period == 'week':
+        d = np.datetime64(day[:10], 'D')
+        return str(d - (d.astype(np.int64) + 3) % 7)  # 1970-01-01 — четверг
+    return day[:{'day': 10, 'month': 7, 'year': 4}[period]]
+
+
+def _period_range(period, first, last):
+    # все периоды от first до last включительно: пустые тоже нужны остатку и изменениям
+    if period == 'week':
+        return np.arange(np.datetime64(first, 'D'), np.datetime64(last, 'D') + 1, 7).astype(str)
+    unit = {'day': 'D', 'month': 'M', 'year': 'Y'}[period]
+    return np.arange(np.datetime64(first, unit), np.datetime64(last, unit) + 1).astype(str)
+
+
+def _compute_report(period, date_from, date_to):
+    with get_conn() as conn:
+        rows = _grouped_rows(conn, period, date_from, date_to)
+        opening = _opening_balance(conn, date_from)
+    if rows:
+        periods_col, cats_col, inc_col, exp_col = zip(*rows)
+    else:
+        periods_col, cats_col, inc_col, exp_col = (), (), (), ()
+    present, pidx = np.unique(np.array(periods_col, dtype=object).astype(str), return_inverse=True)
+    first = _period_key(period, date_from) if date_from else (present[0] if len(present) else None)
+    last = _period_key(period, date_to) if date_to else (present[-1] if len(present) else None)
+    if first is None or last is None or first > last:
+        periods = present
+    else:
+        periods = _period_range(period, first, last)
+        pidx = np.searchsorted(periods, present)[pidx]
+    cats, cidx = np.unique(np.array(cats_col, dtype=np.int64), return_inverse=True)
+    income = np.array(inc_col, dtype=np.int64)
+    expense = np.array(exp_col, dtype=np.int64)
+
+    # матрицы период x категория
+    shape = (len(periods), len(cats))
+    inc_m = np.zeros(shape, dtype=np.int64)
+    exp_m = np.zeros(shape, dtype=np.int64)
+    inc_m[pidx, cidx] = income
+    exp_m[pidx, cidx] = expense
+
+    inc_p = inc_m.sum(axis=1)
+    exp_p = exp_m.sum(axis=1)
+    net = inc_p - exp_p
+    balance = opening + np.cumsum(net)
+    # у первого периода нет предыдущего — изменения для него None
+    inc_delta = np.diff(inc_p)
+    exp_delta = np.diff(exp_p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prev = exp_p[:-1]
+        exp_pct = np.where(prev != 0, exp_delta / np.where(prev != 0, prev, 1) * 100.0, np.nan)
+
+    def with_first_none(values):
+        return [None] + values if len(periods) else []
+
+    m = MINOR_UNITS
+    return {
+        'period': period,
+        'date_from': date_from,
+        'date_to': date_to,
+        'periods': periods.tolist(),
+        'income': (inc_p / m).tolist(),
+        'expense': (exp_p / m).tolist(),
+        'net': (net / m).tolist(),
+        'opening_balance': opening / m,
+        'balance': (balance / m).tolist(),
+        'income_delta': with_first_none((inc_delta / m).tolist()),
+        'expense_delta': with_first_none((exp_delta / m).tolist()),
+        'expense_delta_pct': with_first_none([None if np.isnan(x) else float(x) for x in exp_pct]),
+        'category_ids': cats.tolist(),
+        'category_income': (inc_m / m).tolist(),
+        'category_expense': (exp_m / m).tolist(),
+    }
+
+
+def period_report(period='month', date_from=None, date_to=None):
+    # результат кэшируется по (база, период, диапазон, версия данных)
+    if period not in PERIOD_KEYS:
+        raise ValueError(f'неизвестный период: {period}')
+    key = (db.DB_PATH, period, date_from, date_to, get_data_version())
+    report = _report_cache.get(key)
+    if report is None:
+        report = _compute_report(period, date_from, date_to)
+        _report_cache[key] = report
+        while len(_report_cache) > REPORT_CACHE_SIZE:
+            _report_cache.popitem(last=False)
+    else:
+        _report_cache.move_to_end(key)
+    # имена категорий подставляются при каждом вызове: переименование не меняет версию
+    names = {c['id']: c['name'] for c in get_categories()}
+    result = dict(report)
+    result['category_names'] = [names.get(c, 'Без категории') for c in report['category_ids']]
+    return result
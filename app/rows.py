@@ -0,0 +1,115 @@
+import sys
+from array import array
+from collections.abc import Sequence
+
+# компактное представление операций: вместо словаря на каждую строку —
+# объект со __slots__ (страницы) или столбцы в массивах (полная выборка);
+# повторяющиеся строки (даты, типы, валюты, категории) интернируются.
+# Доступ как к словарю (row['date'], row.get('note'), dict(row)) сохранён.
+
+FIELDS = ('id', 'date', 'amount', 'currency', 'type', 'category_id', 'note', 'category_name', 'category_icon')
+_FIELD_SET = frozenset(FIELDS)
+
+
+def intern_or_none(s):
+    return sys.intern(s) if s is not None else None
+
+
+class TransactionRow:
+    __slots__ = FIELDS
+
+    def __init__(self, id, date, amount, currency, type, category_id, note, category_name, category_icon):
+        self.id = id
+        self.date = date
+        self.amount = amount
+        self.currency = currency
+        self.type = type
+        self.category_id = category_id
+        self.note = note
+        self.category_name = category_name
+        self.category_icon = category_icon
+
+    def __getitem__(self, key):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in _FIELD_SET:
+            return default
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in _FIELD_SET
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def keys(self):
+        return FIELDS
+
+    def values(self):
+        return [getattr(self, f) for f in FIELDS]
+
+    def items(self):
+        return [(f, getattr(self, f)) for f in FIELDS]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, TransactionRow):
+            return self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return f'TransactionRow({self.to_dict()!r})'
+
+
+class TransactionBatch(Sequence):
+    # столбцы: id, amount, category_id — массивы чисел; строки — списки интернированных значений;
+    # имена и иконки категорий хранятся один раз на категорию
+    NO_CATEGORY = 0  # в category_ids вместо None (id категорий начинаются с 1)
+
+    def __init__(self):
+        self.ids = array('q')
+        self.amounts = array('d')
+        self.category_ids = array('q')
+        self.dates = []
+        self.currencies = []
+        self.types = []
+        self.notes = []
+        self._categories = {}  # id -> (name, icon)
+
+    def append(self, id, date, amount, currency, type, category_id, note, category_name, category_icon):
+        self.ids.append(id)
+        self.amounts.append(amount)
+        if category_id is None:
+            self.category_ids.append(self.NO_CATEGORY)
+        else:
+            self.category_ids.append(category_id)
+            if category_id not in self._categories:
+                self._categories[category_id] = (category_name, category_icon)
+        self.dates.append(intern_or_none(date))
+        self.currencies.append(intern_or_none(currency))
+        self.types.append(intern_or_none(type))
+        self.notes.append(note)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        cid = self.category_ids[i]
+        if cid == self.NO_CATEGORY:
+            cid, name, icon = None, None, None
+        else:
+            name, icon = self._categories[cid]
+        return TransactionRow(self.ids[i], self.dates[i], self.amounts[i], self.currencies[i], self.types[i],
+                              cid, self.notes[i], name, icon)
@@ -1,43 +1,56 @@
 import sys, os
 import csv
+import gzip
+import io
+from contextlib import closing, contextmanager
 from pathlib import Path
-from app.db import add_transaction, get_transactions, get_categories, add_category, clear_transactions
+from app.db import iter_transactions
+from app.importer import import_files, CHUNK_ROWS
 
-def export_csv(path: str):
-    rows = get_transactions()
-    keys = ['date', 'amount', 'type', 'category_name', 'note']
-    with open(path, 'w', newline='', encoding='utf-8') as f:
+
+@contextmanager
+def _open_output(path):
+    # сжатие выбирается по расширению файла
+    lower = str(path).lower()
+    if lower.endswith('.gz'):
+        with gzip.open(path, 'wt', compresslevel=6, newline='', encoding='utf-8') as f:
+            yield f
+    elif lower.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError('Для экспорта в .zst установите пакет zstandard')
+        with open(path, 'wb') as raw:
+            with zstandard.ZstdCompressor().stream_writer(raw) as zf:
+                with io.TextIOWrapper(zf, encoding='utf-8', newline='') as f:
+                    yield f
+    else:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            yield f
+
+
+def export_csv(path: str, date_from=None, date_to=None, category_ids=None, chunk_size=1000):
+    rows = iter_transactions(chunk_size=chunk_size, date_from=date_from, date_to=date_to, category_ids=category_ids)
+    keys = ['date', 'amount', 'type', 'category_name', 'note', 'currency']
+    n = 0
+    # при ошибке записи генератор закрывается сразу, а не когда его соберёт сборщик мусора
+    with closing(rows), _open_output(path) as f:
         writer = csv.DictWriter(f, fieldnames=keys)
         writer.writeheader()
         for r in rows:
             writer.writerow({
                 'date': r['date'],
-                'amount': r['amount'],
+                'amount': f"{r['amount']:.2f}",
                 'type': r['type'],
                 'category_name': r.get('category_name') or '',
-                'note': r.get('note') or ''
+                'note': r.get('note') or '',
+                'currency': r.get('currency') or '',
             })
+            n += 1
+    return n
 
 
-def import_csv(path: str):
-    # загружаем все категории
-    cats = {c['name']: c['id'] for c in get_categories()}
-    # очистка
-    clear_transactions()
-
-    with open(path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            date = row.get('date')
-            amount = float(row.get('amount', 0))
-            ttype = row.get('type', 'Трата')
-            catname = row.get('category_name') or row.get('category') or 'Без категории'
-
-            # создаём категорию если её нет
-            if catname not in cats:
-                new_id = add_category(catname, None)
-                cats[catname] = new_id
-
-            cat_id = cats[catname]
-            note = row.get('note', '')
-            add_transaction(date, amount, ttype, cat_id, note)
+def import_csv(path: str, progress=None, batch_size=CHUNK_ROWS):
+    # заменяет все операции содержимым файла; очистка и загрузка идут одной транзакцией,
+    # строки с ошибками пропускаются (подробности — app.importer.import_files)
+    return import_files([path], mode='replace', progress=progress, chunk_rows=batch_size)['imported']
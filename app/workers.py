@@ -0,0 +1,95 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class Cancelled(Exception):
+    pass
+
+
+class TaskSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    progress = pyqtSignal(object)
+    ended = pyqtSignal()  # отправляется всегда, в том числе после отмены
+
+
+class Task(QRunnable):
+    # выполняет fn(*args, **kwargs) в пуле потоков; результат приходит сигналом
+    def __init__(self, fn, args=(), kwargs=None, with_progress=False):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = dict(kwargs or {})
+        self.signals = TaskSignals()
+        self.cancelled = False
+        if with_progress:
+            self.kwargs['progress'] = self.report_progress
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report_progress(self, value):
+        # вызывается из рабочего потока; отмена прерывает задачу исключением
+        if self.cancelled:
+            raise Cancelled()
+        self.signals.progress.emit(value)
+
+    def run(self):
+        try:
+            if self.cancelled:
+                return
+            try:
+                result = self.fn(*self.args, **self.kwargs)
+            except Cancelled:
+                return
+            except Exception as e:
+                if not self.cancelled:
+                    self.signals.failed.emit(e)
+                return
+            if not self.cancelled:
+                self.signals.finished.emit(result)
+        finally:
+            self.signals.ended.emit()
+
+
+class TaskRunner(QObject):
+    # задачи с одинаковым key схлопываются: новая отменяет ещё не завершённую
+    def __init__(self, parent=None, max_threads=2):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._tasks = {}
+        self._keys = {}
+
+    def submit(self, fn, *args, key=None, on_done=None, on_error=None, on_progress=None, **kwargs):
+        if key is not None and key in self._keys:
+            self._keys.pop(key).cancel()
+        task = Task(fn, args, kwargs, with_progress=on_progress is not None)
+        if on_done:
+            task.signals.finished.connect(on_done)
+        if on_error:
+            task.signals.failed.connect(on_error)
+        if on_progress:
+            task.signals.progress.connect(on_progress)
+        task.signals.ended.connect(lambda: self._forget(task, key))
+        self._tasks[id(task)] = task
+        if key is not None:
+            self._keys[key] = task
+        self.pool.start(task)
+        return task
+
+    def _forget(self, task, key):
+        self._tasks.pop(id(task), None)
+        if key is not None and self._keys.get(key) is task:
+            del self._keys[key]
+
+    def is_running(self, key):
+        return key in self._keys
+
+    def shutdown(self, timeout_ms=5000):
+        for task in self._tasks.values():
+            task.cancel()
+        self.pool.clear()
+        self.pool.waitForDone(timeout_ms)
+        self._tasks.clear()
+        self._keys.clear()
@@ -0,0 +1,12 @@
+import pytest
+
+from app import db
+
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    old_path = db.DB_PATH
+    db.set_db_path(tmp_path / 'finance.db')
+    db.init_db()
+    yield
+    db.set_db_path(old_path)
@@ -0,0 +1,141 @@
+import pytest
+
+from app import db
+from app.migrations import MIGRATIONS
+
+
+def _fill(n=200):
+    food = db.add_category('Еда')
+    fun = db.add_category('Развлечения')
+    ids = []
+    for i in range(n):
+        ttype = 'Доход' if i % 5 == 0 else 'Трата'
+        category = (food, fun, None)[i % 3]
+        ids.append(db.add_transaction(f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}', 10 + i, ttype, category, f'заметка {i}'))
+    return food, fun, ids
+
+
+def _edit(food, fun, ids):
+    db.update_transaction(ids[1], '2025-03-15', 99, 'Трата', fun, 'изменено')
+    db.update_transaction(ids[2], '2025-04-01', 15, 'Доход', None, '')
+    db.delete_transaction(ids[3])
+
+
+def _table(sql):
+    with db.get_conn() as conn:
+        return sorted(tuple(r) for r in conn.execute(sql))
+
+
+def _maintained_and_rebuilt(*queries):
+    # содержимое сводных таблиц, которое поддерживают триггеры, и оно же после полного пересчёта;
+    # строки с нулевыми счётчиками пересчёт не создаёт, поэтому запросы их отбрасывают
+    maintained = [_table(sql) for sql in queries]
+    db.rebuild_aggregates()
+    return maintained, [_table(sql) for sql in queries]
+
+
+def test_migrations_reach_latest_version(fresh_db):
+    with db.get_conn() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+
+
+def test_hot_queries_use_indexes(fresh_db):
+    _fill()
+    assert db.check_query_plans() == []
+
+
+def test_triggers_match_rebuild(fresh_db):
+    food, fun, ids = _fill()
+    _edit(food, fun, ids)
+    db.delete_category(food)
+    maintained, rebuilt = _maintained_and_rebuilt(
+        "SELECT balance, tx_count FROM balance_summary",
+        "SELECT * FROM category_totals WHERE tx_count > 0",
+    )
+    assert maintained == rebuilt
+    assert db.get_balance() == pytest.approx(maintained[0][0][0] / db.MINOR_UNITS)
+
+
+def test_daily_totals_match_rebuild(fresh_db):
+    food, fun, ids = _fill()
+    _edit(food, fun, ids)
+    db.delete_category(food)
+    maintained, rebuilt = _maintained_and_rebuilt("SELECT * FROM daily_totals WHERE tx_count > 0")
+    assert maintained == rebuilt
+
+
+def test_fts_follows_edits(fresh_db):
+    food, fun, ids = _fill()
+    _edit(food, fun, ids)
+    db.update_category(fun, 'Кино', None)
+    db.delete_category(food)
+    maintained, rebuilt = _maintained_and_rebuilt("SELECT rowid, note, category FROM transactions_fts")
+    assert maintained == rebuilt
+    assert {r['id'] for r in db.search_transactions('изменено кино')} == {ids[1]}
+
+
+def test_bulk_edits_keep_aggregates(fresh_db):
+    food, fun, ids = _fill()
+    db.set_transactions_category(ids[10:40], fun)
+    db.set_transactions_type(ids[40:60], 'Доход')
+    db.replace_in_notes(ids[60:90], 'заметка', 'запись')
+    db.delete_transactions(ids[90:120])
+    db.undo_bulk()
+    maintained, rebuilt = _maintained_and_rebuilt(
+        "SELECT balance, tx_count FROM balance_summary",
+        "SELECT * FROM category_totals WHERE tx_count > 0",
+        "SELECT * FROM daily_totals WHERE tx_count > 0",
+        "SELECT rowid, note, category FROM transactions_fts",
+    )
+    assert maintained == rebuilt
+
+
+def test_undo_restores_rows(fresh_db):
+    food, fun, ids = _fill(50)
+    before = [db.get_transaction(i) for i in ids]
+    db.set_transactions_category(ids, fun)
+    db.delete_transactions(ids[:10])
+    db.undo_bulk()
+    db.undo_bulk()
+    assert [db.get_transaction(i) for i in ids] == before
+
+
+def test_budget_spent_matches_rebuild(fresh_db):
+    food, fun, ids = _fill()
+    db.set_budget(food, 'month', 500)
+    db.set_budget(fun, 'week', 100)
+    _edit(food, fun, ids)
+    db.set_transactions_category(ids[10:40], fun)
+    db.delete_transactions(ids[90:120])
+    db.undo_bulk()
+    db.delete_category(food)
+    maintained, rebuilt = _maintained_and_rebuilt("SELECT * FROM budget_spent WHERE spent <> 0")
+    assert maintained == rebuilt
+
+
+def test_manual_rows_are_not_imported_again(fresh_db, tmp_path):
+    from app.importer import import_files
+    food = db.add_category('Еда')
+    db.add_transaction('2025-05-01', 120.5, 'Трата', food, 'обед')
+    db.add_transaction('2025-05-01', 120.5, 'Трата', food, 'обед')
+    path = tmp_path / 'bank.csv'
+    path.write_text(
+        'date,amount,type,category,note\n'
+        '2025-05-01,120.50,Трата,Еда,обед\n'
+        '2025-05-01,120.50,Трата,Еда,обед\n'
+        '2025-05-02,80,Трата,Еда,ужин\n',
+        encoding='utf-8'
+    )
+    result = import_files([path], mode='merge', workers=1)
+    assert (result['imported'], result['skipped']) == (1, 2)
+
+
+def test_archive_search_uses_current_category_names(fresh_db):
+    food = db.add_category('Еда')
+    old = db.add_transaction('2020-03-01', 50, 'Трата', food, 'кофе')
+    new = db.add_transaction('2025-03-01', 70, 'Трата', food, 'кофе')
+    db.archive_year(2020)
+    db.update_category(food, 'Продукты', None)
+    assert {r['id'] for r in db.search_transactions('продукты')} == {old, new}
+    assert db.search_transactions('еда') == []
+    assert {r['id'] for r in db.search_transactions('кофе прод')} == {old, new}
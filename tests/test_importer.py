@@ -0,0 +1,83 @@
+import gzip
+
+import pytest
+
+from app import db
+from app.importer import import_files, parse_amount, parse_chunk, parse_date
+
+HEADER = ['date', 'amount', 'type', 'category', 'note']
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1234', (123400, False)),
+    ('-1234.56', (123456, True)),
+    ('1 234,56', (123456, False)),
+    ('1\xa0234,56', (123456, False)),
+    ('+15,5', (1550, False)),
+    ('-0', (0, False)),
+    ('12.345', (1235, False)),
+    ('1e3', (100000, False)),
+    ('-2.5E2', (25000, True)),
+])
+def test_parse_amount(text, expected):
+    assert parse_amount(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    '', 'abc', 'nan', 'inf', '(12.50)', '1,234.56', '1e30', '99999999999999999999',
+])
+def test_parse_amount_rejects(text):
+    with pytest.raises(ValueError):
+        parse_amount(text)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2024-01-31', '2024-01-31'),
+    ('2024-01-31 12:00:00', '2024-01-31'),
+    ('2024-01-31T12:00', '2024-01-31'),
+    ('31.01.2024', '2024-01-31'),
+    ('31/01/2024', '2024-01-31'),
+    ('31.01.24', '2024-01-31'),
+])
+def test_parse_date(text, expected):
+    assert parse_date(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', '2024-02-30', '2024-13-01', '31.02.2024', 'вчера', '2024/31/01'])
+def test_parse_date_rejects(text):
+    with pytest.raises(ValueError):
+        parse_date(text)
+
+
+def test_bad_fields_become_rejects():
+    rows = [
+        (2, ['2024-01-31', '1 234,56', 'Трата', 'Еда', 'обед']),
+        (3, ['2024-01-31', '1e30', 'Трата', 'Еда', '']),
+        (4, ['2024-01-31', '99999999999999999999', '', '', '']),
+        (5, ['2024-02-30', '10', '', '', '']),
+        (6, ['2024-01-31', '10', 'перевод', '', '']),
+    ]
+    good, rejects = parse_chunk('bank.csv', HEADER, rows)
+    assert [r[:6] for r in good] == [('2024-01-31', 123456, 'RUB', 'Трата', 'Еда', 'обед')]
+    assert [r[1] for r in rejects] == [3, 4, 5, 6]
+
+
+@pytest.mark.parametrize('name', ['bank.csv', 'bank.csv.gz'])
+def test_import_file_with_bom(fresh_db, tmp_path, name):
+    path = tmp_path / name
+    data = '\ufeffdate,amount,type\n2024-01-31,10,Доход\n2024-02-01,1e30,Доход\n'.encode('utf-8')
+    path.write_bytes(gzip.compress(data) if name.endswith('.gz') else data)
+    result = import_files([path], workers=1)
+    assert (result['imported'], result['rejected']) == (1, 1)
+    assert db.get_balance() == 10
+
+
+def test_rejected_file_stays_importable(fresh_db, tmp_path):
+    bad = tmp_path / 'bad.csv'
+    bad.write_text('when,sum\n2024-01-31,10\n', encoding='utf-8')
+    empty = tmp_path / 'empty.csv'
+    empty.write_text('date,amount\n2024-01-31,abc\n', encoding='utf-8')
+    first = import_files([bad, empty], mode='merge', workers=1)
+    assert (first['imported'], first['rejected']) == (0, 2)
+    again = import_files([bad, empty], mode='merge', workers=1)
+    assert (again['files'], again['skipped_files']) == (2, 0)
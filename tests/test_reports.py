@@ -0,0 +1,41 @@
+import pytest
+
+from app import db
+
+np = pytest.importorskip('numpy')
+from app.reports import period_report  # noqa: E402
+
+
+def test_empty_periods_are_filled(fresh_db):
+    db.add_transaction('2023-03-05', 100, 'Трата')
+    db.add_transaction('2024-01-10', 50, 'Трата')
+    db.add_transaction('2024-03-01', 200, 'Доход')
+    report = period_report('month')
+    assert report['periods'][0] == '2023-03'
+    assert report['periods'][-3:] == ['2024-01', '2024-02', '2024-03']
+    assert len(report['periods']) == 13
+    assert report['expense_delta'][:2] == [None, -100.0]
+    assert report['expense_delta_pct'][:2] == [None, -100.0]
+    assert report['balance'][-3:] == [-150.0, -150.0, 50.0]
+
+
+def test_week_range_follows_bounds(fresh_db):
+    db.add_transaction('2024-01-10', 50, 'Трата')
+    report = period_report('week', '2024-01-01', '2024-01-21')
+    assert report['periods'] == ['2024-01-01', '2024-01-08', '2024-01-15']
+    assert report['expense'] == [0.0, 50.0, 0.0]
+    assert report['expense_delta'] == [None, 50.0, -50.0]
+
+
+def test_cache_is_per_database(tmp_path):
+    old_path = db.DB_PATH
+    try:
+        reports = []
+        for name, amount in (('a.db', 100), ('b.db', 70)):
+            db.set_db_path(tmp_path / name)
+            db.init_db()
+            db.add_transaction('2024-01-10', amount, 'Трата')
+            reports.append(period_report('month'))
+        assert [r['expense'] for r in reports] == [[100.0], [70.0]]
+    finally:
+        db.set_db_path(old_path)
@@ -0,0 +1,31 @@
+import csv
+import sqlite3
+
+from app import db
+from app.utils import export_csv
+
+
+def test_export_reads_in_chunks(fresh_db, tmp_path):
+    for i in range(25):
+        db.add_transaction(f'202{i % 2 + 3}-01-{i % 5 + 1:02d}', i + 1, 'Трата', note=f'n{i}')
+    db.archive_year(2023)
+    path = tmp_path / 'out.csv'
+    assert export_csv(path, chunk_size=4) == 25
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert sorted(r['note'] for r in rows) == sorted(f'n{i}' for i in range(25))
+    assert [r['date'] for r in rows] == sorted((r['date'] for r in rows), reverse=True)
+
+
+def test_unfinished_export_does_not_hold_a_transaction(fresh_db):
+    for i in range(10):
+        db.add_transaction('2025-01-01', i + 1, 'Трата')
+    rows = db.iter_transactions(chunk_size=3)
+    next(rows)
+    tid = db.add_transaction('2025-02-01', 5, 'Доход')
+    other = sqlite3.connect(db.DB_PATH)
+    try:
+        assert other.execute("SELECT 1 FROM transactions WHERE id=?", (tid,)).fetchone() == (1,)
+    finally:
+        other.close()
+        rows.close()